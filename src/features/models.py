@@ -16,7 +16,7 @@ if TYPE_CHECKING:
     from src.features.material import MaterialAdvantage
 
 
-@dataclass
+@dataclass(slots=True)
 class BasePiece:
     """駒の基本情報
 
@@ -33,7 +33,7 @@ class BasePiece:
     square: str
 
 
-@dataclass
+@dataclass(slots=True)
 class PieceInfo(BasePiece):
     """駒ごとの詳細情報（盤上の駒のみ）
 
@@ -53,7 +53,7 @@ class PieceInfo(BasePiece):
     activity: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class SquareInfo:
     """マスごとの情報（81マス分）
 
@@ -5,10 +5,12 @@
 囲い認識、戦法認識、玉の安全度計算などの高次元特徴を抽出する。
 """
 
-import math
+import functools
+from collections import OrderedDict
 from typing import Dict, List, Tuple
 
 import cshogi
+import numpy as np
 
 from src.features.models import CastlePattern, KingSafety, StrategyPattern
 from src.features.patterns.castles import ALL_CASTLES, CastleCondition, CastleDefinition
@@ -34,6 +36,7 @@ PIECE_TYPE_TO_JAPANESE = {
 }
 
 
+@functools.lru_cache(maxsize=None)
 def _square_to_file_rank(square_name: str) -> Tuple[int, int]:
     """
     日本語座標からfile, rankを取得する。
@@ -63,6 +66,7 @@ def _file_rank_to_square(file: int, rank: int) -> str:
     return f"{file + 1}{RANK_KANJI[rank]}"
 
 
+@functools.lru_cache(maxsize=None)
 def _mirror_square(square_name: str) -> str:
     """
     後手用にマスを反転する。
@@ -83,6 +87,98 @@ def _mirror_square(square_name: str) -> str:
     return _file_rank_to_square(mirrored_file, mirrored_rank)
 
 
+def _build_neighbor_tables() -> Tuple[Tuple[Tuple[int, ...], ...], ...]:
+    """
+    玉の位置（0-80）ごとの近傍マステーブルを構築する。
+
+    玉の位置と近傍マスの関係は盤面に依存しないため、
+    モジュールインポート時に一度だけ計算しておく。
+
+    Returns:
+        (距離1のマス, 距離2のマス, 距離2以内の全マス) のタプル。
+        各テーブルはマスインデックス（0-80）で引く。
+    """
+    d1_table = []
+    d2_table = []
+    d1_2_table = []
+
+    for king_sq in range(81):
+        king_file = king_sq // 9
+        king_rank = king_sq % 9
+
+        squares_within_1 = []
+        squares_within_2 = []
+        all_squares_within_2 = []
+
+        for df in range(-2, 3):
+            for dr in range(-2, 3):
+                if df == 0 and dr == 0:
+                    continue  # 玉自身は除く
+
+                new_file = king_file + df
+                new_rank = king_rank + dr
+
+                if 0 <= new_file <= 8 and 0 <= new_rank <= 8:
+                    new_sq = new_file * 9 + new_rank
+                    distance = max(abs(df), abs(dr))  # チェビシェフ距離
+
+                    all_squares_within_2.append(new_sq)
+                    if distance == 1:
+                        squares_within_1.append(new_sq)
+                    elif distance == 2:
+                        squares_within_2.append(new_sq)
+
+        d1_table.append(tuple(squares_within_1))
+        d2_table.append(tuple(squares_within_2))
+        d1_2_table.append(tuple(all_squares_within_2))
+
+    return tuple(d1_table), tuple(d2_table), tuple(d1_2_table)
+
+
+# 玉の位置ごとの近傍マステーブル（距離1 / 距離2 / 距離2以内）
+NEIGHBORS_D1, NEIGHBORS_D2, NEIGHBORS_D1_2 = _build_neighbor_tables()
+
+
+# ========================================
+# Zobristハッシュによる特徴量キャッシュ
+# ========================================
+#
+# 棋譜の再生や局面木の解析では同一局面（合流・変化手順）が繰り返し
+# 現れるため、トップレベルの特徴抽出結果をZobristハッシュをキーに
+# キャッシュする。サイズ上限を超えたら最も古いエントリを捨てる。
+
+_CACHE_MAX_SIZE = 8192
+
+_castle_cache: "OrderedDict[int, Tuple[CastlePattern, ...]]" = OrderedDict()
+_strategy_cache: "OrderedDict[int, Tuple[StrategyPattern, ...]]" = OrderedDict()
+_king_safety_cache: "OrderedDict[Tuple[int, str], KingSafety]" = OrderedDict()
+
+
+def _cache_get(cache: OrderedDict, key):
+    """キャッシュからエントリを取得する（ヒット時は最新に移動）。"""
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _cache_put(cache: OrderedDict, key, value) -> None:
+    """キャッシュにエントリを追加する（上限超過時は最古を削除）。"""
+    cache[key] = value
+    if len(cache) > _CACHE_MAX_SIZE:
+        cache.popitem(last=False)
+
+
+# 81x81の全マス間ユークリッド距離テーブル（小数点以下1桁で丸め）
+# 盤の形は変わらないため、インポート時に一度だけ計算する。
+# float64のまま保持する（float32に落とすとスコア合計に誤差が乗り、
+# min_confidenceちょうどのパターンの判定が変わってしまう）
+DIST_TABLE = np.sqrt(
+    ((np.arange(81) // 9)[:, None] - (np.arange(81) // 9)[None, :]) ** 2
+    + ((np.arange(81) % 9)[:, None] - (np.arange(81) % 9)[None, :]) ** 2
+).round(1)
+
+
 def _calculate_distance(square1: str, square2: str) -> float:
     """
     2つのマス間のユークリッド距離を計算する。
@@ -96,8 +192,7 @@ def _calculate_distance(square1: str, square2: str) -> float:
     """
     file1, rank1 = _square_to_file_rank(square1)
     file2, rank2 = _square_to_file_rank(square2)
-    distance = math.sqrt((file1 - file2) ** 2 + (rank1 - rank2) ** 2)
-    return round(distance, 1)
+    return float(DIST_TABLE[file1 * 9 + rank1, file2 * 9 + rank2])
 
 
 def _get_pieces_on_board(board: cshogi.Board, color: int) -> Dict[str, List[str]]:
@@ -288,6 +383,11 @@ def recognize_castles(board: cshogi.Board) -> List[CastlePattern]:
         >>> len(castles)  # 初期局面では囲いなし
         0
     """
+    zobrist = board.zobrist_hash()
+    cached = _cache_get(_castle_cache, zobrist)
+    if cached is not None:
+        return list(cached)
+
     results: List[CastlePattern] = []
 
     # 先手の駒を取得
@@ -316,6 +416,7 @@ def recognize_castles(board: cshogi.Board) -> List[CastlePattern]:
                 confidence=round(gote_confidence, 2)
             ))
 
+    _cache_put(_castle_cache, zobrist, tuple(results))
     return results
 
 
@@ -341,6 +442,11 @@ def recognize_strategies(board: cshogi.Board) -> List[StrategyPattern]:
     """
     from src.features.patterns.strategies import ALL_STRATEGIES, StrategyCondition, StrategyDefinition
 
+    zobrist = board.zobrist_hash()
+    cached = _cache_get(_strategy_cache, zobrist)
+    if cached is not None:
+        return list(cached)
+
     results: List[StrategyPattern] = []
 
     # 先手・後手の駒を取得
@@ -375,6 +481,7 @@ def recognize_strategies(board: cshogi.Board) -> List[StrategyPattern]:
                 confidence=round(gote_confidence, 2)
             ))
 
+    _cache_put(_strategy_cache, zobrist, tuple(results))
     return results
 
 
@@ -595,6 +702,11 @@ def calculate_king_safety(board: cshogi.Board, color: str) -> KingSafety:
         density: 玉から2マス以内の自駒数 / 2マス以内のマス数
         safety_score: gold_count * 10 + density * 50
     """
+    cache_key = (board.zobrist_hash(), color)
+    cached = _cache_get(_king_safety_cache, cache_key)
+    if cached is not None:
+        return cached
+
     cshogi_color = cshogi.BLACK if color == "先手" else cshogi.WHITE
     enemy_color = cshogi.WHITE if color == "先手" else cshogi.BLACK
 
@@ -616,39 +728,20 @@ def calculate_king_safety(board: cshogi.Board, color: str) -> KingSafety:
 
     if king_sq is None:
         # 玉が見つからない場合はデフォルト値を返す
-        return KingSafety(
+        result = KingSafety(
             color=color,
             king_square=king_square,
             gold_count=0,
             density=0.0,
             safety_score=0
         )
+        _cache_put(_king_safety_cache, cache_key, result)
+        return result
 
-    king_file = king_sq // 9
-    king_rank = king_sq % 9
-
-    # 2マス以内のマスを取得
-    squares_within_1 = []  # 隣接マス（距離1）
-    squares_within_2 = []  # 距離2のマス
-    all_squares_within_2 = []  # 距離2以内のすべてのマス
-
-    for df in range(-2, 3):
-        for dr in range(-2, 3):
-            if df == 0 and dr == 0:
-                continue  # 玉自身は除く
-
-            new_file = king_file + df
-            new_rank = king_rank + dr
-
-            if 0 <= new_file <= 8 and 0 <= new_rank <= 8:
-                new_sq = new_file * 9 + new_rank
-                distance = max(abs(df), abs(dr))  # チェビシェフ距離
-
-                all_squares_within_2.append(new_sq)
-                if distance == 1:
-                    squares_within_1.append(new_sq)
-                elif distance == 2:
-                    squares_within_2.append(new_sq)
+    # 2マス以内のマスを事前計算テーブルから取得
+    squares_within_1 = NEIGHBORS_D1[king_sq]  # 隣接マス（距離1）
+    squares_within_2 = NEIGHBORS_D2[king_sq]  # 距離2のマス
+    all_squares_within_2 = NEIGHBORS_D1_2[king_sq]  # 距離2以内のすべてのマス
 
     # 金駒スコアを計算
     # 隣接マスの金駒×2 + 2マス離れの金駒 - 2マス以内の敵駒
@@ -703,13 +796,15 @@ def calculate_king_safety(board: cshogi.Board, color: str) -> KingSafety:
     # 総合安全度スコアを計算
     safety_score = int(gold_count * 10 + density * 50)
 
-    return KingSafety(
+    result = KingSafety(
         color=color,
         king_square=king_square,
         gold_count=gold_count,
         density=round(density, 2),
         safety_score=safety_score
     )
+    _cache_put(_king_safety_cache, cache_key, result)
+    return result
 
 
 def calculate_piece_activity(
@@ -9,6 +9,8 @@ cshogiを使用して81マスの情報と持ち駒を抽出する。
 
 from __future__ import annotations
 
+from collections import OrderedDict
+
 import cshogi
 
 from src.features.models import BasePiece, HandPieces, PieceInfo, SquareInfo
@@ -101,24 +103,48 @@ def get_adjacent_squares(sq: int) -> dict[str, str | None]:
         >>> adj["下"]
         '5六'
     """
-    file = sq // 9
-    rank = sq % 9
+    return ADJACENT8_TABLE[sq]
 
-    adjacent = {}
-    for (df, dr), name in DIRECTION_NAMES.items():
-        new_file = file + df
-        new_rank = rank + dr
 
-        if 0 <= new_file <= 8 and 0 <= new_rank <= 8:
-            new_sq = new_file * 9 + new_rank
-            adjacent[name] = index_to_japanese(new_sq)
-        else:
-            adjacent[name] = None
+def _build_adjacent8_table() -> tuple[dict[str, str | None], ...]:
+    """81マス分の隣接マス辞書を事前計算する。
+
+    隣接関係は盤面に依存しないため、モジュールインポート時に
+    一度だけ計算してテーブル参照に置き換える。
 
-    return adjacent
+    Returns:
+        マスインデックス（0-80）で引く隣接マス辞書のタプル
+    """
+    table = []
+    for sq in range(81):
+        file = sq // 9
+        rank = sq % 9
+
+        adjacent: dict[str, str | None] = {}
+        for (df, dr), name in DIRECTION_NAMES.items():
+            new_file = file + df
+            new_rank = rank + dr
+
+            if 0 <= new_file <= 8 and 0 <= new_rank <= 8:
+                new_sq = new_file * 9 + new_rank
+                adjacent[name] = index_to_japanese(new_sq)
+            else:
+                adjacent[name] = None
 
+        table.append(adjacent)
 
-def extract_square_info(board: cshogi.Board, sq: int) -> SquareInfo:
+    return tuple(table)
+
+
+# マスごとの隣接マステーブル（get_adjacent_squares用）
+ADJACENT8_TABLE = _build_adjacent8_table()
+
+
+def extract_square_info(
+    board: cshogi.Board,
+    sq: int,
+    tables: tuple[list, list, list] | None = None,
+) -> SquareInfo:
     """1マスの情報を抽出する。
 
     指定されたマスの駒情報、利き情報、隣接マス情報を抽出する。
@@ -126,6 +152,8 @@ def extract_square_info(board: cshogi.Board, sq: int) -> SquareInfo:
     Args:
         board: cshogiのBoardオブジェクト
         sq: マスインデックス（0-80）
+        tables: _compute_attack_tablesの結果。Noneなら
+            このマスの利き情報をその場で計算する
 
     Returns:
         SquareInfo: マスの情報
@@ -173,9 +201,15 @@ def extract_square_info(board: cshogi.Board, sq: int) -> SquareInfo:
         )
 
     # 利き情報の計算
-    direct_attackers = _get_attackers(board, sq, direct=True)
-    indirect_attackers = _get_attackers(board, sq, direct=False)
-    attack_balance = _calculate_attack_balance(board, sq)
+    if tables is not None:
+        direct_table, indirect_table, balance_table = tables
+        direct_attackers = direct_table[sq]
+        indirect_attackers = indirect_table[sq]
+        attack_balance = balance_table[sq]
+    else:
+        direct_attackers = _get_attackers(board, sq, direct=True)
+        indirect_attackers = _get_attackers(board, sq, direct=False)
+        attack_balance = _calculate_attack_balance(board, sq)
 
     return SquareInfo(
         square=square_jp,
@@ -187,6 +221,23 @@ def extract_square_info(board: cshogi.Board, sq: int) -> SquareInfo:
     )
 
 
+def iter_square_infos(board: cshogi.Board):
+    """81マスの情報を遅延生成する。
+
+    一部のマスだけを消費する呼び出し元のために、
+    SquareInfoを1マスずつ生成するジェネレータを提供する。
+
+    Args:
+        board: cshogiのBoardオブジェクト
+
+    Yields:
+        SquareInfo: 各マスの情報（マスインデックス順）
+    """
+    tables = _compute_attack_tables(board)
+    for sq in range(81):
+        yield extract_square_info(board, sq, tables)
+
+
 def extract_all_squares(board: cshogi.Board) -> list[SquareInfo]:
     """81マス全ての情報を抽出する。
 
@@ -196,7 +247,27 @@ def extract_all_squares(board: cshogi.Board) -> list[SquareInfo]:
     Returns:
         81マス分のSquareInfoリスト
     """
-    return [extract_square_info(board, sq) for sq in range(81)]
+    return list(iter_square_infos(board))
+
+
+def extract_occupied_square_infos(board: cshogi.Board) -> list[SquareInfo]:
+    """駒のあるマスだけの情報を抽出する。
+
+    空きマスのSquareInfoを生成しないため、全マス抽出より
+    アロケーションを大幅に減らせる。
+
+    Args:
+        board: cshogiのBoardオブジェクト
+
+    Returns:
+        駒のあるマスのSquareInfoリスト（マスインデックス順）
+    """
+    tables = _compute_attack_tables(board)
+    return [
+        extract_square_info(board, sq, tables)
+        for sq in range(81)
+        if board.piece(sq) != cshogi.NONE
+    ]
 
 
 def extract_hand_pieces(board: cshogi.Board) -> list[HandPieces]:
@@ -228,6 +299,192 @@ def extract_hand_pieces(board: cshogi.Board) -> list[HandPieces]:
 # 内部関数
 # ========================================
 
+# Zobristハッシュをキーとした利き情報キャッシュ
+# 局面木の解析では同一局面を再訪するため、(ハッシュ, マス, 直接/間接)ごとの
+# 走査結果をキャッシュする。BasePieceの代わりに軽量なタプルで保持し、
+# ヒット時に再構築する。上限超過時は最も古いエントリを捨てる。
+_ATTACKERS_CACHE_MAX_SIZE = 65536
+_attackers_cache: "OrderedDict[tuple[int, int, bool], tuple[tuple[str, str, str], ...]]" = OrderedDict()
+
+
+def _iter_occupied(board: cshogi.Board):
+    """盤上の駒があるマスを列挙する。
+
+    board.piece(sq)を81回呼ぶ代わりに、board.piecesで盤面全体を
+    一度だけ取得し、駒のあるマスだけを返す。
+
+    Args:
+        board: cshogiのBoardオブジェクト
+
+    Yields:
+        (マスインデックス, 駒コード) のタプル
+    """
+    for sq, piece_code in enumerate(board.pieces):
+        if piece_code != cshogi.NONE:
+            yield sq, piece_code
+
+
+def _build_ray_tables():
+    """マス間の直線（レイ）テーブルを事前計算する。
+
+    2マス間の幾何学的な関係は盤面に依存しないため、
+    インポート時に一度だけ計算しておく。
+
+    Returns:
+        (ray_table, vertical, diagonal, orthogonal) のタプル。
+        ray_table[a][b] は a と b が縦・横・斜めで一直線上にあるとき
+        その間（両端を除く）のマスのタプル、そうでなければ None。
+        vertical / diagonal / orthogonal は各マスから縦 / 斜め / 縦横
+        方向に到達可能なマスのfrozenset（マスインデックスで引く）。
+    """
+    ray_table: list[list[tuple[int, ...] | None]] = [[None] * 81 for _ in range(81)]
+    vertical = [set() for _ in range(81)]
+    diagonal = [set() for _ in range(81)]
+    orthogonal = [set() for _ in range(81)]
+
+    for a in range(81):
+        file_a = a // 9
+        rank_a = a % 9
+        for df, dr in ((-1, -1), (-1, 0), (-1, 1), (0, -1),
+                       (0, 1), (1, -1), (1, 0), (1, 1)):
+            between: list[int] = []
+            f, r = file_a + df, rank_a + dr
+            while 0 <= f <= 8 and 0 <= r <= 8:
+                b = f * 9 + r
+                ray_table[a][b] = tuple(between)
+                if df == 0:
+                    vertical[a].add(b)
+                if df != 0 and dr != 0:
+                    diagonal[a].add(b)
+                if df == 0 or dr == 0:
+                    orthogonal[a].add(b)
+                between.append(b)
+                f += df
+                r += dr
+
+    return (
+        ray_table,
+        tuple(frozenset(s) for s in vertical),
+        tuple(frozenset(s) for s in diagonal),
+        tuple(frozenset(s) for s in orthogonal),
+    )
+
+
+RAY, _ALIGNED_VERTICAL, _ALIGNED_DIAGONAL, _ALIGNED_ORTHOGONAL = _build_ray_tables()
+
+# 飛び駒ごとの幾何学的に到達可能なマス集合
+# 香は_find_blocking_pieceと同様、縦方向のみ（両向き）をチェックする
+ALIGNED_BY_PIECE = {
+    cshogi.LANCE: _ALIGNED_VERTICAL,
+    cshogi.BISHOP: _ALIGNED_DIAGONAL,
+    cshogi.PROM_BISHOP: _ALIGNED_DIAGONAL,
+    cshogi.ROOK: _ALIGNED_ORTHOGONAL,
+    cshogi.PROM_ROOK: _ALIGNED_ORTHOGONAL,
+}
+
+
+# 飛び駒の走査方向（間接利き判定用）
+# 香は_find_blocking_pieceと同様、縦方向のみをチェックする
+_SLIDER_RAYS = {
+    cshogi.LANCE: ((0, -1), (0, 1)),
+    cshogi.BISHOP: ((-1, -1), (-1, 1), (1, -1), (1, 1)),
+    cshogi.PROM_BISHOP: ((-1, -1), (-1, 1), (1, -1), (1, 1)),
+    cshogi.ROOK: ((-1, 0), (1, 0), (0, -1), (0, 1)),
+    cshogi.PROM_ROOK: ((-1, 0), (1, 0), (0, -1), (0, 1)),
+}
+
+
+def _compute_attack_tables(
+    board: cshogi.Board,
+) -> tuple[list[list[BasePiece]], list[list[BasePiece]], list[int]]:
+    """全81マスの利き情報を盤面1回の走査でまとめて計算する。
+
+    マスごとに_get_attackersを呼ぶと駒の利き計算が何度も重複するため、
+    盤上の各駒の利きを一度だけ計算し、利き先マス側のテーブルに
+    振り分ける。結果は_get_attackers / _calculate_attack_balanceを
+    マスごとに呼んだ場合と一致する。
+
+    Args:
+        board: cshogiのBoardオブジェクト
+
+    Returns:
+        (直接利きテーブル, 間接利きテーブル, 利きバランステーブル)
+        各テーブルはマスインデックス（0-80）で引く
+    """
+    direct_table: list[list[BasePiece]] = [[] for _ in range(81)]
+    indirect_table: list[list[BasePiece]] = [[] for _ in range(81)]
+    balance_table = [0] * 81
+
+    # 盤上の駒とその利きを一度だけ収集
+    pieces = board.pieces
+    occupied = []
+    attacks_by_sq: dict[int, list[int]] = {}
+    for sq, piece_code in enumerate(pieces):
+        if piece_code == cshogi.NONE:
+            continue
+
+        piece_type = piece_code & 0x0F
+        is_white = (piece_code & 0x10) != 0
+        piece_color = cshogi.WHITE if is_white else cshogi.BLACK
+
+        attacks = get_piece_attacks(board, sq, piece_type, piece_color, pieces)
+        occupied.append((sq, piece_type, is_white, attacks))
+        attacks_by_sq[sq] = attacks
+
+    for sq, piece_type, is_white, attacks in occupied:
+        attacker = BasePiece(
+            piece_type=PIECE_TYPE_TO_JAPANESE.get(piece_type, "不明"),
+            color="後手" if is_white else "先手",
+            square=index_to_japanese(sq),
+        )
+        balance_delta = -1 if is_white else 1
+
+        # 直接利き
+        for target_sq in attacks:
+            direct_table[target_sq].append(attacker)
+            balance_table[target_sq] += balance_delta
+
+        # 間接利き（飛び駒のみ）
+        rays = _SLIDER_RAYS.get(piece_type)
+        if rays is None:
+            continue
+
+        file = sq // 9
+        rank = sq % 9
+
+        for df, dr in rays:
+            # 最初にブロックしている駒を探す
+            f, r = file + df, rank + dr
+            blocking_sq = None
+            while 0 <= f <= 8 and 0 <= r <= 8:
+                current_sq = f * 9 + r
+                if pieces[current_sq] != cshogi.NONE:
+                    blocking_sq = current_sq
+                    break
+                f += df
+                r += dr
+
+            if blocking_sq is None:
+                continue
+
+            # ②間の駒が味方かチェック
+            blocking_code = pieces[blocking_sq]
+            if ((blocking_code & 0x10) != 0) != is_white:
+                continue
+
+            # ③間の駒の利き先のうち、ブロック駒より先のマスが間接利き
+            blocking_attacks = set(attacks_by_sq[blocking_sq])
+            f, r = f + df, r + dr
+            while 0 <= f <= 8 and 0 <= r <= 8:
+                target_sq = f * 9 + r
+                if target_sq in blocking_attacks:
+                    indirect_table[target_sq].append(attacker)
+                    balance_table[target_sq] += balance_delta
+                f += df
+                r += dr
+
+    return direct_table, indirect_table, balance_table
+
 
 def _get_attackers(
     board: cshogi.Board, target_sq: int, direct: bool = True
@@ -248,10 +505,19 @@ def _get_attackers(
         ②間の駒が味方の駒
         ③間の駒も対象マスに利きがある
     """
+    cache_key = (board.zobrist_hash(), target_sq, direct)
+    cached = _attackers_cache.get(cache_key)
+    if cached is not None:
+        _attackers_cache.move_to_end(cache_key)
+        return [
+            BasePiece(piece_type=pt, color=color, square=square)
+            for pt, color, square in cached
+        ]
+
     attackers = []
 
-    for sq in range(81):
-        piece_code = board.piece(sq)
+    pieces = board.pieces
+    for sq, piece_code in enumerate(pieces):
         if piece_code == cshogi.NONE:
             continue
 
@@ -259,7 +525,7 @@ def _get_attackers(
         is_white = (piece_code & 0x10) != 0
         piece_color = cshogi.WHITE if is_white else cshogi.BLACK
 
-        attacks = get_piece_attacks(board, sq, piece_type, piece_color)
+        attacks = get_piece_attacks(board, sq, piece_type, piece_color, pieces)
 
         if direct:
             # 直接利き
@@ -273,17 +539,17 @@ def _get_attackers(
                 )
         else:
             # 間接利き（飛び駒が間に味方駒を挟んでいて、その味方駒が対象に利きがある）
-            if piece_type not in [
-                cshogi.LANCE,
-                cshogi.BISHOP,
-                cshogi.ROOK,
-                cshogi.PROM_BISHOP,
-                cshogi.PROM_ROOK,
-            ]:
+            aligned = ALIGNED_BY_PIECE.get(piece_type)
+            if aligned is None:
                 continue
-            
+
+            # 幾何学的に対象マスへ届かない飛び駒は盤面を見る前に除外
+            if target_sq not in aligned[sq]:
+                continue
+
+
             # 対象マスへの直線上を調べる
-            blocking_piece = _find_blocking_piece(board, sq, target_sq, piece_type)
+            blocking_piece = _find_blocking_piece(board, sq, target_sq, piece_type, pieces)
             if blocking_piece is None:
                 continue
             
@@ -297,7 +563,7 @@ def _get_attackers(
             # ③間の駒が対象マスに利きがあるかチェック
             blocking_type = blocking_code & 0x0F
             blocking_color = cshogi.WHITE if blocking_is_white else cshogi.BLACK
-            blocking_attacks = get_piece_attacks(board, blocking_sq, blocking_type, blocking_color)
+            blocking_attacks = get_piece_attacks(board, blocking_sq, blocking_type, blocking_color, pieces)
             
             if target_sq in blocking_attacks:
                 # 間接利き成立
@@ -309,11 +575,18 @@ def _get_attackers(
                     )
                 )
 
+    _attackers_cache[cache_key] = tuple(
+        (a.piece_type, a.color, a.square) for a in attackers
+    )
+    if len(_attackers_cache) > _ATTACKERS_CACHE_MAX_SIZE:
+        _attackers_cache.popitem(last=False)
+
     return attackers
 
 
 def _find_blocking_piece(
-    board: cshogi.Board, from_sq: int, to_sq: int, piece_type: int
+    board: cshogi.Board, from_sq: int, to_sq: int, piece_type: int,
+    pieces: list[int] | None = None
 ) -> tuple[int, int] | None:
     """飛び駒の直線上で最初にブロックしている駒を見つける。
     
@@ -322,58 +595,25 @@ def _find_blocking_piece(
         from_sq: 飛び駒のマス
         to_sq: 対象マス
         piece_type: 飛び駒の駒種
+        pieces: board.piecesのスナップショット（省略可）
     
     Returns:
         (駒のマス, 駒コード) のタプル、または None
     """
-    from_file = from_sq // 9
-    from_rank = from_sq % 9
-    to_file = to_sq // 9
-    to_rank = to_sq % 9
-    
-    # 方向を計算
-    df = 0 if to_file == from_file else (1 if to_file > from_file else -1)
-    dr = 0 if to_rank == from_rank else (1 if to_rank > from_rank else -1)
-    
-    # 直線上かチェック
-    if df == 0 and dr == 0:
+    # 駒種に応じた方向チェック（事前計算テーブル参照）
+    aligned = ALIGNED_BY_PIECE.get(piece_type)
+    if aligned is None or to_sq not in aligned[from_sq]:
         return None
-    
-    # 駒種に応じた方向チェック
-    if piece_type == cshogi.LANCE:
-        # 香は前方のみ（先手なら上方向、後手なら下方向）
-        # ここでは単純に縦方向のみチェック
-        if df != 0:
-            return None
-    elif piece_type in [cshogi.BISHOP, cshogi.PROM_BISHOP]:
-        # 角は斜め方向のみ
-        if df == 0 or dr == 0:
-            return None
-        if abs(to_file - from_file) != abs(to_rank - from_rank):
-            return None
-    elif piece_type in [cshogi.ROOK, cshogi.PROM_ROOK]:
-        # 飛は縦横のみ
-        if df != 0 and dr != 0:
-            return None
-    
-    # 直線上を走査
-    current_file = from_file + df
-    current_rank = from_rank + dr
-    
-    while 0 <= current_file <= 8 and 0 <= current_rank <= 8:
-        current_sq = current_file * 9 + current_rank
-        
-        if current_sq == to_sq:
-            return None  # 対象マスに到達（間に駒なし）
-        
-        piece = board.piece(current_sq)
+
+    # 直線上（両端を除く）を走査
+    if pieces is None:
+        pieces = board.pieces
+    for current_sq in RAY[from_sq][to_sq]:
+        piece = pieces[current_sq]
         if piece != cshogi.NONE:
             return (current_sq, piece)  # ブロックしている駒を発見
-        
-        current_file += df
-        current_rank += dr
-    
-    return None
+
+    return None  # 対象マスまで間に駒なし
 
 
 def _calculate_attack_balance(board: cshogi.Board, target_sq: int) -> int:
@@ -388,18 +628,67 @@ def _calculate_attack_balance(board: cshogi.Board, target_sq: int) -> int:
     Returns:
         利きバランス（正=先手有利、負=後手有利）
     """
-    # 直接利きと間接利きを取得
-    direct_attackers = _get_attackers(board, target_sq, direct=True)
-    indirect_attackers = _get_attackers(board, target_sq, direct=False)
-    
-    sente_attacks = 0
-    gote_attacks = 0
-    
-    for attacker in direct_attackers + indirect_attackers:
-        if attacker.color == "先手":
-            sente_attacks += 1
-        else:
-            gote_attacks += 1
+    return _attack_balance_fast(board, target_sq)
+
+
+def _attack_balance_fast(board: cshogi.Board, target_sq: int) -> int:
+    """指定マスの利きバランスを盤面1回の走査で計算する。
+
+    _get_attackersを直接・間接で2回呼ぶと盤面を2回走査して
+    BasePieceリストを生成することになるが、バランスに必要なのは
+    ±1のカウンタだけなので、1回の走査で直接利き・間接利きを
+    判定しながら集計する。結果は_get_attackers 2回分と一致する。
+
+    Args:
+        board: cshogiのBoardオブジェクト
+        target_sq: 対象マス（0-80）
+
+    Returns:
+        利きバランス（正=先手有利、負=後手有利）
+    """
+    balance = 0
+    pieces = board.pieces
+    blocking_attacks_cache: dict[int, set[int]] = {}
+
+    for sq, piece_code in enumerate(pieces):
+        if piece_code == cshogi.NONE:
+            continue
+
+        piece_type = piece_code & 0x0F
+        is_white = (piece_code & 0x10) != 0
+        piece_color = cshogi.WHITE if is_white else cshogi.BLACK
+        delta = -1 if is_white else 1
+
+        # 直接利き（直接・間接は同一直線上なので両立しない）
+        attacks = get_piece_attacks(board, sq, piece_type, piece_color, pieces)
+        if target_sq in attacks:
+            balance += delta
+            continue
+
+        # 間接利き（飛び駒のみ）
+        aligned = ALIGNED_BY_PIECE.get(piece_type)
+        if aligned is None or target_sq not in aligned[sq]:
+            continue
+
+        blocking_piece = _find_blocking_piece(board, sq, target_sq, piece_type, pieces)
+        if blocking_piece is None:
+            continue
+
+        blocking_sq, blocking_code = blocking_piece
+        if ((blocking_code & 0x10) != 0) != is_white:
+            continue  # 敵駒なら間接利きではない
+
+        blocking_attacks = blocking_attacks_cache.get(blocking_sq)
+        if blocking_attacks is None:
+            blocking_type = blocking_code & 0x0F
+            blocking_color = cshogi.WHITE if (blocking_code & 0x10) != 0 else cshogi.BLACK
+            blocking_attacks = set(
+                get_piece_attacks(board, blocking_sq, blocking_type, blocking_color, pieces)
+            )
+            blocking_attacks_cache[blocking_sq] = blocking_attacks
+
+        if target_sq in blocking_attacks:
+            balance += delta
 
-    return sente_attacks - gote_attacks
+    return balance
 
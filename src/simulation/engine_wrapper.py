@@ -61,6 +61,8 @@ class YaneuraouWrapper:
         """
         self.config = config or EngineConfig()
         self._engine: Engine | None = None
+        # SFENパース用のスクラッチ盤面（呼び出しごとのBoard生成を避ける）
+        self._board = Board()
     
     def connect(self) -> None:
         """
@@ -88,35 +90,66 @@ class YaneuraouWrapper:
             self._engine.quit()
             self._engine = None
     
-    def analyze(self, sfen: str) -> list[CandidateMove]:
+    def analyze(self, sfen: str, nodes: int | None = None) -> list[CandidateMove]:
         """
         局面を分析し、候補手のリストを取得する。
         
         Args:
             sfen: 分析対象の局面（SFEN形式）
+            nodes: このコールだけ探索ノード数を上書きする場合に指定。
+                同一エンジンを強弱2つの設定で使い分けられる
             
         Returns:
             候補手のリスト（評価値順）
         """
+        # 手番判定はスクラッチ盤面を再利用する
+        self._board.set_sfen(sfen)
+        return self._analyze(sfen, None, self._board.turn, nodes)
+
+    def analyze_moves(
+        self, start_sfen: str, moves: list[str], turn: int
+    ) -> list[CandidateMove]:
+        """
+        開始局面からの手順で局面を指定して分析する。
+
+        1手進めるごとにSFEN文字列を再生成・再パースする代わりに、
+        `position ... moves ...` 形式でエンジンに送る。
+
+        Args:
+            start_sfen: 開始局面（SFEN形式）
+            moves: 開始局面からの手順（USI形式）
+            turn: 現局面の手番（cshogi.BLACK または cshogi.WHITE）
+
+        Returns:
+            候補手のリスト（評価値順）
+        """
+        return self._analyze(start_sfen, moves, turn)
+
+    def _analyze(
+        self,
+        sfen: str,
+        moves: list[str] | None,
+        turn: int,
+        nodes: int | None = None,
+    ) -> list[CandidateMove]:
+        """局面設定と探索の共通処理。"""
         if self._engine is None:
             self.connect()
         
         # 局面設定
         self._engine.usinewgame()
-        self._engine.position(sfen=sfen)
+        self._engine.position(moves=moves, sfen=sfen)
 
-        # 手番（SFENの手番）を取得
         # USIのscore(cp/mate)は「手番側から見た値」なので、ここで
         # 『先手有利=正、後手有利=負』に正規化する。
-        board = Board()
-        board.set_sfen(sfen)
-        sente_multiplier = 1 if board.turn == cshogi.BLACK else -1
+        sente_multiplier = 1 if turn == cshogi.BLACK else -1
         
         # MultiPVリスナーで探索
         listener = MultiPVListener()
-        if self.config.nodes is not None:
+        search_nodes = nodes if nodes is not None else self.config.nodes
+        if search_nodes is not None:
             # ノード数制限で探索
-            self._engine.go(nodes=self.config.nodes, listener=listener.listen())
+            self._engine.go(nodes=search_nodes, listener=listener.listen())
         else:
             # 秒読みで探索
             self._engine.go(byoyomi=self.config.byoyomi, listener=listener.listen())
@@ -161,7 +194,7 @@ class YaneuraouWrapper:
         Returns:
             各手を進めた後のSFEN形式局面のリスト
         """
-        board = Board()
+        board = self._board
         board.set_sfen(sfen)
         
         positions = []
@@ -7,6 +7,7 @@
 - シミュレーション2: 弱AI vs 強AI 樹形図
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
 import cshogi
@@ -73,29 +74,32 @@ class GameSimulator:
             engine_config: 強AI（やねうら王）の設定
             maia2_config: Maia2の設定（手予測用）
         """
-        # 強AI（通常探索）
+        # やねうら王（強AI: 通常探索 / 弱AI: 20Kノード制限で同一プロセスを共用）
+        # プロセスを分けると置換表(USI_Hash)とスレッドが二重になるため、
+        # 弱AIは探索ノード数の上書きで実現する
         self.strong_engine = YaneuraouWrapper(engine_config)
         
-        # 弱AI（20Kノード制限）- Maia2のvalueが正常動作しないため代用
-        weak_config = EngineConfig(nodes=WEAK_ENGINE_NODES)
-        self.weak_engine = YaneuraouWrapper(weak_config)
-        
         # Maia2（手予測用）
         self.maia2 = Maia2Wrapper(maia2_config)
         
         # Maia2側（ルート局面の手番）を記録
         self._maia2_turn: int | None = None  # cshogi.BLACK or cshogi.WHITE
+
+        # Maia2推論をエンジン探索と重ねるためのスレッドプール
+        self._executor: ThreadPoolExecutor | None = None
     
     def connect(self) -> None:
         """AIに接続する。"""
         self.strong_engine.connect()
-        self.weak_engine.connect()
         self.maia2.load()
+        self._executor = ThreadPoolExecutor(max_workers=1)
     
     def disconnect(self) -> None:
         """AIとの接続を終了する。"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
         self.strong_engine.disconnect()
-        self.weak_engine.disconnect()
         self.maia2.unload()
     
     def simulate(self, sfen: str) -> SimulationTree:
@@ -142,9 +146,22 @@ class GameSimulator:
         Returns:
             PositionEvaluation: 全AIの評価結果
         """
+        # Maia2推論（ONNX）はエンジン探索と別リソースで動くため、
+        # エンジンの2回の探索と並行して実行する。強AI・弱AIは同一
+        # エンジンプロセスを共用しているため直列のまま
+        # （強い探索を先に行うことで置換表が温まり、弱い探索も同じ
+        # エントリを再利用できる）。
+        maia2_future = None
+        if self._executor is not None:
+            maia2_future = self._executor.submit(self.maia2.predict, sfen)
+
         strong_candidates = self.strong_engine.analyze(sfen)
-        weak_candidates = self.weak_engine.analyze(sfen)
-        maia2_result = self.maia2.predict(sfen)
+        weak_candidates = self.strong_engine.analyze(sfen, nodes=WEAK_ENGINE_NODES)
+
+        if maia2_future is not None:
+            maia2_result = maia2_future.result()
+        else:
+            maia2_result = self.maia2.predict(sfen)
         
         return PositionEvaluation(
             sfen=sfen,
@@ -197,43 +214,46 @@ class GameSimulator:
         records = []
         board = Board()
         board.set_sfen(sfen)
-        current_sfen = sfen
-        
+        moves: list[str] = []
+
         for _ in range(BEST_LINE_MOVES):
-            # 強AIで最善手を取得
-            candidates = self.strong_engine.analyze(current_sfen)
+            # 強AIで最善手を取得（開始局面+手順で指定し、SFEN再パースを避ける）
+            candidates = self.strong_engine.analyze_moves(sfen, moves, board.turn)
             if not candidates:
                 break
-            
+
             best = candidates[0]
-            
+
             # 手を進める
             board.push_usi(best.move)
-            current_sfen = board.sfen()
-            
+            moves.append(best.move)
+
             records.append(MoveRecord(
-                sfen=current_sfen,
+                sfen=board.sfen(),
                 move=best.move,
                 score=best.score,
                 win_rate=best.win_rate,
             ))
-        
+
         return records
     
     def _build_tree(self, sfen: str) -> TreeNode:
         """
         弱AI vs 強AI の樹形図を構築する。
-        
+
+        幅優先でレベルごとに展開し、同一レベルの子局面に対する
+        Maia2推論を1回のバッチ推論にまとめる。
+
         Args:
             sfen: 開始局面
-            
+
         Returns:
             樹形図のルートノード
         """
         # ルートノードの評価を取得
         evaluation = self._evaluate_position(sfen)
         strong_eval, weak_eval = self._get_maia2_side_win_rate(evaluation)
-        
+
         root = TreeNode(
             sfen=sfen,
             move=None,
@@ -243,81 +263,114 @@ class GameSimulator:
             is_terminal=False,
             children=[],
         )
-        
-        # 再帰的に樹形図を構築（ルートの評価結果を渡す）
-        self._expand_node(root, is_maia2_turn=True, evaluation=evaluation)
-        
+
+        # (ノード, Maia2の手番か, 取得済み評価) のレベルリスト
+        level: list[tuple[TreeNode, bool, PositionEvaluation]] = [
+            (root, True, evaluation)
+        ]
+
+        while level:
+            # このレベルで展開するノードと子局面を確定する
+            pending: list[tuple[TreeNode, bool, list[tuple[str, str]]]] = []
+            for node, is_maia2_turn, node_evaluation in level:
+                candidates = self._select_candidates(
+                    node, is_maia2_turn, node_evaluation
+                )
+                if not candidates:
+                    continue
+
+                child_sfens = []
+                for move in candidates:
+                    # 手を進めて新しい局面を生成
+                    board = Board()
+                    board.set_sfen(node.sfen)
+                    board.push_usi(move)
+                    child_sfens.append((move, board.sfen()))
+
+                pending.append((node, is_maia2_turn, child_sfens))
+
+            # レベル内の全子局面のMaia2推論をまとめて実行
+            all_sfens = [
+                child_sfen
+                for _, _, child_sfens in pending
+                for _, child_sfen in child_sfens
+            ]
+            maia2_results = self.maia2.predict_batch(all_sfens)
+
+            # 子ノードを生成して次のレベルへ
+            next_level: list[tuple[TreeNode, bool, PositionEvaluation]] = []
+            result_index = 0
+            for node, is_maia2_turn, child_sfens in pending:
+                for move, child_sfen in child_sfens:
+                    child_evaluation = PositionEvaluation(
+                        sfen=child_sfen,
+                        strong_candidates=self.strong_engine.analyze(child_sfen),
+                        weak_candidates=self.strong_engine.analyze(
+                            child_sfen, nodes=WEAK_ENGINE_NODES
+                        ),
+                        maia2_result=maia2_results[result_index],
+                    )
+                    result_index += 1
+
+                    strong_eval, weak_eval = self._get_maia2_side_win_rate(
+                        child_evaluation
+                    )
+                    child = TreeNode(
+                        sfen=child_sfen,
+                        move=move,
+                        depth=node.depth + 1,
+                        strong_eval_win_rate=strong_eval,
+                        weak_eval_win_rate=weak_eval,
+                        is_terminal=False,
+                        children=[],
+                    )
+                    node.children.append(child)
+                    next_level.append((child, not is_maia2_turn, child_evaluation))
+
+            level = next_level
+
         return root
-    
-    def _expand_node(
-        self, 
-        node: TreeNode, 
+
+    def _select_candidates(
+        self,
+        node: TreeNode,
         is_maia2_turn: bool,
-        evaluation: PositionEvaluation | None = None,
-    ) -> None:
+        evaluation: PositionEvaluation,
+    ) -> list[str]:
         """
-        ノードを展開する（再帰）。
-        
+        ノードの終端判定と候補手の選択を行う。
+
         Args:
-            node: 展開するノード
+            node: 展開対象のノード
             is_maia2_turn: Maia2の手番か
-            evaluation: 既に取得済みの評価結果（あれば再利用）
+            evaluation: ノードの評価結果
+
+        Returns:
+            候補手のリスト（終端なら空リスト）
         """
         # 深さ制限チェック
         if node.depth >= TREE_MAX_DEPTH:
             node.is_terminal = True
-            return
-        
+            return []
+
         # 終端条件チェック（深さ3以上かつ勝率収束）
         if node.depth >= TREE_MIN_DEPTH:
             diff = abs(node.strong_eval_win_rate - node.weak_eval_win_rate)
             if diff <= CONVERGENCE_THRESHOLD:
                 node.is_terminal = True
-                return
-        
-        # 評価結果がなければ取得
-        if evaluation is None:
-            evaluation = self._evaluate_position(node.sfen)
-        
+                return []
+
         if is_maia2_turn:
             # Maia2の手番: 確率10%以上の手を最大3つ
             candidates = self._get_maia2_candidates(evaluation.maia2_result)
         else:
             # 強AIの手番: 最善手1つのみ
             candidates = self._get_yaneuraou_best(evaluation.strong_candidates)
-        
+
         if not candidates:
             node.is_terminal = True
-            return
-        
-        for move in candidates:
-            # 手を進めて新しい局面を生成
-            board = Board()
-            board.set_sfen(node.sfen)
-            board.push_usi(move)
-            child_sfen = board.sfen()
-            
-            # 子ノードの評価を取得（1回の呼び出しで両方取得）
-            child_evaluation = self._evaluate_position(child_sfen)
-            strong_eval, weak_eval = self._get_maia2_side_win_rate(child_evaluation)
-            
-            child = TreeNode(
-                sfen=child_sfen,
-                move=move,
-                depth=node.depth + 1,
-                strong_eval_win_rate=strong_eval,
-                weak_eval_win_rate=weak_eval,
-                is_terminal=False,
-                children=[],
-            )
-            node.children.append(child)
-            
-            # 再帰的に展開（評価結果を渡す）
-            self._expand_node(
-                child, 
-                is_maia2_turn=not is_maia2_turn,
-                evaluation=child_evaluation,
-            )
+
+        return candidates
     
     def _get_maia2_candidates(self, maia2_result: Maia2Prediction) -> list[str]:
         """
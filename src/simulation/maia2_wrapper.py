@@ -41,11 +41,15 @@ class Maia2Config:
         rating_self: 予測対象のレーティング（800-2800）
         rating_oppo: 対戦相手のレーティング（省略時はrating_selfと同じ）
         top_k: 取得する候補手の数
+        dtype: モデルの精度（"fp32" / "fp16" / "int8"）。
+            fp32以外を指定すると初回ロード時に変換済みモデルを生成し、
+            以降はそれを読み込む。
     """
     model_path: str = DEFAULT_MODEL_PATH
     rating_self: int = 1500
     rating_oppo: int | None = None
     top_k: int = 5
+    dtype: str = "fp32"
 
 
 @dataclass
@@ -74,25 +78,29 @@ def _bin_rating(rating: int) -> int:
     return (rating - RATE_MIN) // BIN_WIDTH
 
 
-def _encode_board_dlshogi(board: cshogi.Board) -> np.ndarray:
-    """盤面をdlshogi形式の特徴量に変換する。"""
-    feature1 = np.zeros((FEATURES1_NUM, 9, 9), dtype=np.float32)
-    feature2 = np.zeros((FEATURES2_NUM, 9, 9), dtype=np.float32)
-    make_input_features(board, feature1, feature2)
-    features = np.concatenate([feature1, feature2], axis=0)
-    return np.transpose(features, (1, 2, 0))
+def _build_legal_move_index(
+    board: cshogi.Board,
+) -> tuple[np.ndarray, dict[int, int]]:
+    """合法手のマスクとラベル→手の対応表を一度の走査で生成する。
 
-
-def _get_legal_moves_mask(board: cshogi.Board) -> np.ndarray:
-    """合法手のマスクを生成する。"""
-    mask = np.zeros(MOVE_LABELS, dtype=np.float32)
+    Returns:
+        (合法手マスク, ラベル→手の辞書) のタプル
+    """
+    turn = board.turn
+    label_to_move: dict[int, int] = {}
     for move in board.legal_moves:
         if move == MOVE_END:
             continue
-        label = make_move_label(move, board.turn)
-        if 0 <= label < mask.size:
-            mask[label] = 1.0
-    return mask
+        label = make_move_label(move, turn)
+        if 0 <= label < MOVE_LABELS:
+            label_to_move[label] = move
+
+    # マスクへの書き込みは1要素ずつではなく、ラベルをまとめてfancy indexingで行う
+    mask = np.zeros(MOVE_LABELS, dtype=np.float32)
+    if label_to_move:
+        labels = np.fromiter(label_to_move, dtype=np.int64, count=len(label_to_move))
+        mask[labels] = 1.0
+    return mask, label_to_move
 
 
 def _softmax(logits: np.ndarray) -> np.ndarray:
@@ -108,14 +116,6 @@ def _softmax(logits: np.ndarray) -> np.ndarray:
     return probs.astype(np.float32, copy=False)
 
 
-def _find_move_by_label(board: cshogi.Board, label: int) -> int | None:
-    """ラベルから対応する手を探す。"""
-    for move in board.legal_moves:
-        if make_move_label(move, board.turn) == label:
-            return move
-    return None
-
-
 class Maia2Wrapper:
     """
     Maia2 ONNX推論のラッパークラス。
@@ -136,7 +136,42 @@ class Maia2Wrapper:
         self.config = config or Maia2Config()
         self._session: ort.InferenceSession | None = None
         self._input_names: set[str] = set()
-    
+        self._output_names: list[str] = []
+        self._io_binding: ort.IOBinding | None = None
+        self._ort_inputs: dict[str, ort.OrtValue] = {}
+
+        # 特徴量エンコード用の再利用バッファ（predict呼び出し間で使い回す）
+        # CHWのスクラッチ2面と、ONNX入力になるNHWCバッファ
+        self._feature1 = np.zeros((FEATURES1_NUM, 9, 9), dtype=np.float32)
+        self._feature2 = np.zeros((FEATURES2_NUM, 9, 9), dtype=np.float32)
+        self._feat_buf = np.zeros(
+            (1, 9, 9, FEATURES1_NUM + FEATURES2_NUM), dtype=np.float32
+        )
+
+        # IOBinding用の固定入力ホストバッファ
+        self._rating_self_buf = np.zeros(1, dtype=np.int32)
+        self._rating_oppo_buf = np.zeros(1, dtype=np.int32)
+        self._legal_mask_buf = np.zeros((1, MOVE_LABELS), dtype=np.float32)
+
+    def _encode_board(self, board: cshogi.Board) -> np.ndarray:
+        """盤面をdlshogi形式のNHWC特徴量に変換する（バッファ再利用）。
+
+        中間のconcatenate + 非連続transposeビューを作らず、
+        CHWスクラッチからNHWCバッファへ1回ずつのコピーで書き込む。
+        """
+        self._feature1.fill(0)
+        self._feature2.fill(0)
+        make_input_features(board, self._feature1, self._feature2)
+        np.copyto(
+            self._feat_buf[0, :, :, :FEATURES1_NUM],
+            self._feature1.transpose(1, 2, 0),
+        )
+        np.copyto(
+            self._feat_buf[0, :, :, FEATURES1_NUM:],
+            self._feature2.transpose(1, 2, 0),
+        )
+        return self._feat_buf
+
     def load(self) -> None:
         """
         ONNXモデルをロードする。
@@ -144,19 +179,96 @@ class Maia2Wrapper:
         path = Path(self.config.model_path).expanduser().resolve()
         if not path.exists():
             raise FileNotFoundError(f"ONNXモデルが見つかりません: {path}")
-        
+
+        if self.config.dtype != "fp32":
+            path = self._quantized_model_path(path)
+
         self._session = ort.InferenceSession(
             path.as_posix(),
             providers=["CUDAExecutionProvider", "CPUExecutionProvider"]
         )
         self._input_names = {inp.name for inp in self._session.get_inputs()}
-    
+        self._output_names = [out.name for out in self._session.get_outputs()]
+
+        # 入力OrtValueを一度だけ確保し、呼び出しごとに中身だけ更新する。
+        # CUDA実行時はデバイス上に確保され、毎回のアロケーション＋
+        # ホスト→デバイスコピーを避けられる。
+        device = (
+            "cuda"
+            if self._session.get_providers()[0] == "CUDAExecutionProvider"
+            else "cpu"
+        )
+        self._ort_inputs = {
+            "board": ort.OrtValue.ortvalue_from_numpy(self._feat_buf, device, 0),
+            "rating_self": ort.OrtValue.ortvalue_from_numpy(
+                self._rating_self_buf, device, 0
+            ),
+            "rating_oppo": ort.OrtValue.ortvalue_from_numpy(
+                self._rating_oppo_buf, device, 0
+            ),
+        }
+        if "legal_moves" in self._input_names:
+            self._ort_inputs["legal_moves"] = ort.OrtValue.ortvalue_from_numpy(
+                self._legal_mask_buf, device, 0
+            )
+
+        self._io_binding = self._session.io_binding()
+        for name, ortvalue in self._ort_inputs.items():
+            if name in self._input_names:
+                self._io_binding.bind_ortvalue_input(name, ortvalue)
+        for name in self._output_names:
+            self._io_binding.bind_output(name)
+
+    def _quantized_model_path(self, path: Path) -> Path:
+        """変換済みモデルのパスを返す（未生成なら変換して保存する）。
+
+        入出力はfloat32のまま維持するため、呼び出し側のバッファや
+        IOBindingは精度設定に関わらずそのまま使える。
+
+        Note:
+            fp16変換には任意依存の onnxconverter-common パッケージが
+            必要（int8はonnxruntime同梱の量子化ツールで変換できる）。
+        """
+        dtype = self.config.dtype
+        if dtype not in ("fp16", "int8"):
+            raise ValueError(f"未対応のdtype: {dtype} (fp32/fp16/int8)")
+
+        quantized = path.with_name(f"{path.stem}.{dtype}{path.suffix}")
+        if quantized.exists():
+            return quantized
+
+        if dtype == "int8":
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(
+                path.as_posix(), quantized.as_posix(), weight_type=QuantType.QInt8
+            )
+        else:
+            import onnx
+
+            try:
+                from onnxconverter_common import float16
+            except ImportError as e:
+                raise ImportError(
+                    "dtype='fp16' には onnxconverter-common パッケージが必要です。"
+                    "pip install onnxconverter-common でインストールしてください。"
+                ) from e
+
+            model = onnx.load(path.as_posix())
+            model = float16.convert_float_to_float16(model, keep_io_types=True)
+            onnx.save(model, quantized.as_posix())
+
+        return quantized
+
     def unload(self) -> None:
         """
         モデルをアンロードする。
         """
         self._session = None
         self._input_names = set()
+        self._output_names = []
+        self._io_binding = None
+        self._ort_inputs = {}
     
     def predict(self, sfen: str) -> Maia2Prediction:
         """
@@ -181,56 +293,135 @@ class Maia2Wrapper:
         board.set_sfen(sfen)
         
         # 特徴量を生成
-        features = _encode_board_dlshogi(board).astype(np.float32)
-        legal_mask = _get_legal_moves_mask(board)
-        
-        # ONNX入力を準備
+        self._encode_board(board)
+        legal_mask, label_to_move = _build_legal_move_index(board)
+
+        # 固定バッファを更新し、対応するOrtValueへ同期する
+        self._rating_self_buf[0] = rating_self_bin
+        self._rating_oppo_buf[0] = rating_oppo_bin
+        np.copyto(self._legal_mask_buf[0], legal_mask)
+
+        self._ort_inputs["board"].update_inplace(self._feat_buf)
+        self._ort_inputs["rating_self"].update_inplace(self._rating_self_buf)
+        self._ort_inputs["rating_oppo"].update_inplace(self._rating_oppo_buf)
+        if "legal_moves" in self._ort_inputs:
+            self._ort_inputs["legal_moves"].update_inplace(self._legal_mask_buf)
+
+        # 推論実行
+        self._session.run_with_iobinding(self._io_binding)
+        outputs = self._io_binding.copy_outputs_to_cpu()
+
+        policy_logits = np.asarray(outputs[0])[0].astype(np.float32)
+        value_logit = float(np.asarray(outputs[1]).reshape(-1)[0])
+
+        return self._postprocess(policy_logits, value_logit, legal_mask, label_to_move)
+
+    def predict_batch(self, sfens: list[str]) -> list[Maia2Prediction]:
+        """
+        複数局面をまとめて推論する。
+
+        局面ごとにpredictを呼ぶ代わりに、特徴量をバッチ次元に積んで
+        1回のONNX実行で処理する。GPU実行時はカーネル起動コストが
+        局面数で償却される。
+
+        Args:
+            sfens: 分析対象の局面のリスト（SFEN形式）
+
+        Returns:
+            各局面に対応するMaia2予測結果のリスト（入力と同順）
+        """
+        if not sfens:
+            return []
+
+        if self._session is None:
+            self.load()
+
+        rating_self_bin = _bin_rating(self.config.rating_self)
+        rating_oppo = self.config.rating_oppo or self.config.rating_self
+        rating_oppo_bin = _bin_rating(rating_oppo)
+
+        batch_size = len(sfens)
+        features = np.zeros(
+            (batch_size, 9, 9, FEATURES1_NUM + FEATURES2_NUM), dtype=np.float32
+        )
+        legal_masks = np.zeros((batch_size, MOVE_LABELS), dtype=np.float32)
+        label_maps: list[dict[int, int]] = []
+
+        board = cshogi.Board()
+        for i, sfen in enumerate(sfens):
+            board.set_sfen(sfen)
+            np.copyto(features[i], self._encode_board(board)[0])
+            legal_mask, label_to_move = _build_legal_move_index(board)
+            legal_masks[i] = legal_mask
+            label_maps.append(label_to_move)
+
+        # バッチ入力はサイズが呼び出しごとに変わるため、固定バッファの
+        # IOBindingではなく通常のrunを使う
         inputs = {
-            "board": features[np.newaxis, ...],
-            "rating_self": np.array([rating_self_bin], dtype=np.int32),
-            "rating_oppo": np.array([rating_oppo_bin], dtype=np.int32),
+            "board": features,
+            "rating_self": np.full(batch_size, rating_self_bin, dtype=np.int32),
+            "rating_oppo": np.full(batch_size, rating_oppo_bin, dtype=np.int32),
         }
         if "legal_moves" in self._input_names:
-            inputs["legal_moves"] = legal_mask[np.newaxis, ...].astype(np.float32)
-        
-        # 推論実行
+            inputs["legal_moves"] = legal_masks
+
         outputs = self._session.run(None, inputs)
-        
-        policy_logits = np.asarray(outputs[0])[0].astype(np.float32)
-        value_logit = float(np.asarray(outputs[1]).reshape(-1)[0])
-        
+
+        policy_logits = np.asarray(outputs[0]).astype(np.float32)
+        value_logits = np.asarray(outputs[1]).reshape(batch_size)
+
+        return [
+            self._postprocess(
+                policy_logits[i], float(value_logits[i]), legal_masks[i], label_maps[i]
+            )
+            for i in range(batch_size)
+        ]
+
+    def _postprocess(
+        self,
+        policy_logits: np.ndarray,
+        value_logit: float,
+        legal_mask: np.ndarray,
+        label_to_move: dict[int, int],
+    ) -> Maia2Prediction:
+        """1局面分の推論出力からMaia2Predictionを構築する。
+
+        policy_logitsは呼び出し元で使い捨ての配列なので、
+        コピーせず直接マスキングして書き換える。
+        """
         # 非合法手をマスキング
-        masked_logits = np.array(policy_logits, copy=True)
-        masked_logits[legal_mask < 0.5] = -1e4
-        policy_probs = _softmax(masked_logits)
-        
+        policy_logits[legal_mask < 0.5] = -1e4
+        policy_probs = _softmax(policy_logits)
+
         # 勝率を計算
         value = float(1.0 / (1.0 + np.exp(-value_logit)))
-        
+
         # 上位k個の候補手を取得
-        top_k = self.config.top_k
-        top_indices = np.argsort(policy_probs)[::-1][:top_k]
-        
+        # 全ラベルのソートは不要なので、argpartitionでk個だけ選んでから並べ替える
+        top_k = min(self.config.top_k, policy_probs.size)
+        partitioned = np.argpartition(policy_probs, -top_k)[-top_k:]
+        top_indices = partitioned[np.argsort(policy_probs[partitioned])[::-1]]
+
         top_moves = []
         for label in top_indices:
             label = int(label)
             prob = float(policy_probs[label])
-            move = _find_move_by_label(board, label)
+            move = label_to_move.get(label)
             if move is not None:
                 move_usi = cshogi.move_to_usi(move)
                 top_moves.append((move_usi, prob))
-        
+
         # 最も確率が高い手
         best_move = top_moves[0][0] if top_moves else ""
         best_prob = top_moves[0][1] if top_moves else 0.0
-        
+
         return Maia2Prediction(
             move=best_move,
             probability=best_prob,
             value=value,
             top_moves=top_moves,
         )
-    
+
     def __enter__(self):
         """コンテキストマネージャーのenter。"""
         self.load()
@@ -8,6 +8,8 @@
 from dataclasses import dataclass
 import math
 
+import numpy as np
+
 
 @dataclass
 class CandidateMove:
@@ -77,9 +79,33 @@ def score_to_win_rate(score: int) -> float:
     Returns:
         勝率（0.0〜1.0）
     """
+    if -_WIN_RATE_CLIP <= score <= _WIN_RATE_CLIP:
+        return float(_WIN_RATE_LUT[int(score) + _WIN_RATE_CLIP])
+    # 詰みスコアなどLUT範囲外はシグモイドを直接計算する
     return 1.0 / (1.0 + math.exp(-score / 600.0))
 
 
+# 勝率変換のLUT。評価値は整数で、実戦の大半が±3000cpに収まるため、
+# 呼び出しごとのmath.expを事前計算済み配列の参照に置き換える。
+_WIN_RATE_CLIP = 3000
+_WIN_RATE_LUT = 1.0 / (
+    1.0 + np.exp(-np.arange(-_WIN_RATE_CLIP, _WIN_RATE_CLIP + 1) / 600.0)
+)
+
+
+def score_to_win_rate_array(scores: np.ndarray) -> np.ndarray:
+    """
+    評価値の配列をまとめて勝率に変換する。
+
+    Args:
+        scores: 評価値（centipawn）の配列
+
+    Returns:
+        勝率（0.0〜1.0）の配列（float64）
+    """
+    return 1.0 / (1.0 + np.exp(-np.asarray(scores, dtype=np.float64) / 600.0))
+
+
 # ============================================================
 # 形勢明確化シミュレーション用データ構造
 # ============================================================
@@ -6,6 +6,8 @@
 局面分析の結果を一つにまとめて返す。
 """
 
+from concurrent.futures import ThreadPoolExecutor
+
 from src.simulation.models import SimulationResult
 from src.simulation.engine_wrapper import YaneuraouWrapper, EngineConfig
 from src.simulation.maia2_wrapper import Maia2Wrapper, Maia2Config
@@ -37,6 +39,12 @@ class ShogiSimulator:
         """
         self.yaneuraou = YaneuraouWrapper(engine_config)
         self.maia2 = Maia2Wrapper(maia2_config)
+
+        # やねうら王とMaia2を並行実行するためのスレッドプール
+        self._executor: ThreadPoolExecutor | None = None
+
+        # SFEN -> 分析結果のキャッシュ（同一局面の再訪時に再解析を省く）
+        self._result_cache: dict[str, SimulationResult] = {}
     
     def connect(self) -> None:
         """
@@ -44,11 +52,15 @@ class ShogiSimulator:
         """
         self.yaneuraou.connect()
         self.maia2.load()
+        self._executor = ThreadPoolExecutor(max_workers=2)
     
     def disconnect(self) -> None:
         """
         両方のAIとの接続を終了する。
         """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
         self.yaneuraou.disconnect()
         self.maia2.unload()
     
@@ -62,9 +74,55 @@ class ShogiSimulator:
         Returns:
             SimulationResult: 統合された分析結果
         """
-        # やねうら王で分析
-        candidates = self.yaneuraou.analyze(sfen)
-        
+        return self.analyze_batch([sfen])[0]
+
+    def analyze_batch(self, sfens: list[str]) -> list[SimulationResult]:
+        """
+        複数の局面をまとめて分析する。
+
+        Maia2は全局面を1回のバッチ推論に集約し、やねうら王の探索は
+        その間にワーカースレッドで順次実行する。USIエンジンは
+        バッチ化できないため局面ごとの探索になるが、ONNX側の
+        カーネル起動と特徴量抽出のオーバーヘッドは局面数で償却される。
+
+        Args:
+            sfens: 分析対象の局面のリスト（SFEN形式）
+
+        Returns:
+            各局面に対応するSimulationResultのリスト（入力と同順）
+        """
+        if not sfens:
+            return []
+
+        # 同一局面（合流・定跡の再訪）はキャッシュで済ませ、
+        # 未解析の局面だけを重複排除してエンジンに渡す
+        misses: list[str] = []
+        seen: set[str] = set()
+        for sfen in sfens:
+            if sfen not in self._result_cache and sfen not in seen:
+                seen.add(sfen)
+                misses.append(sfen)
+
+        if misses:
+            if self._executor is not None:
+                maia2_future = self._executor.submit(self.maia2.predict_batch, misses)
+                candidates_list = [self.yaneuraou.analyze(sfen) for sfen in misses]
+                maia2_results = maia2_future.result()
+            else:
+                candidates_list = [self.yaneuraou.analyze(sfen) for sfen in misses]
+                maia2_results = self.maia2.predict_batch(misses)
+
+            for sfen, candidates, maia2_result in zip(
+                misses, candidates_list, maia2_results
+            ):
+                self._result_cache[sfen] = self._build_result(
+                    sfen, candidates, maia2_result
+                )
+
+        return [self._result_cache[sfen] for sfen in sfens]
+
+    def _build_result(self, sfen, candidates, maia2_result) -> SimulationResult:
+        """1局面分の分析結果を組み立てる。"""
         if candidates:
             best = candidates[0]
             best_move = best.move
@@ -79,9 +137,6 @@ class ShogiSimulator:
             best_pv = []
             pv_positions = []
         
-        # Maia2で分析
-        maia2_result = self.maia2.predict(sfen)
-        
         return SimulationResult(
             sfen=sfen,
             best_move=best_move,
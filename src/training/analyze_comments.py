@@ -4,35 +4,56 @@ import glob
 import os
 from collections import Counter
 
+def iter_json_entries(text):
+    """JSON配列のテキストから要素を1件ずつ取り出すジェネレータ。
+
+    json.load()のように配列全体をリスト化すると、パース結果の
+    dictリストがテキスト本体の何倍ものメモリを占有する。
+    raw_decodeで1要素ずつ取り出せばピークメモリはエントリ1件分で済む。
+    """
+    decoder = json.JSONDecoder()
+    idx = text.find('[')
+    if idx == -1:
+        return
+    idx += 1
+    n = len(text)
+    while idx < n:
+        # 区切り文字と空白をスキップ
+        while idx < n and text[idx] in ' \t\r\n,':
+            idx += 1
+        if idx >= n or text[idx] == ']':
+            return
+        entry, idx = decoder.raw_decode(text, idx)
+        yield entry
+
 def analyze_comment_lengths(input_dir, threshold=100):
     json_files = glob.glob(os.path.join(input_dir, "*.json"))
     total_entries = 0
     long_comments = 0
     length_dist = Counter()
-    
+
     print(f"Checking {len(json_files)} files in {input_dir}...")
-    
+
     for file_path in json_files:
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                for entry in data:
+                for entry in iter_json_entries(f.read()):
                     total_entries += 1
                     comment = entry.get('comment', '')
                     length = len(comment)
-                    
+
                     if length >= threshold:
                         long_comments += 1
-                    
+
                     # 分布用（50文字刻み）
                     bucket = (length // 50) * 50
                     length_dist[bucket] += 1
         except Exception as e:
             print(f"Error reading {file_path}: {e}")
-            
+
     print(f"\nTotal entries: {total_entries}")
     print(f"Entries with comment >= {threshold} chars: {long_comments} ({long_comments/total_entries*100:.1f}%)")
-    
+
     print("\nLength Distribution:")
     for bucket in sorted(length_dist.keys()):
         range_str = f"{bucket}-{bucket+49}"
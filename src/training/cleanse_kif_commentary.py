@@ -6,8 +6,10 @@
 対局解説に関連するコメントのみを残す。
 """
 
+import functools
 import re
 import os
+from multiprocessing import Pool
 from pathlib import Path
 from typing import Optional
 
@@ -33,6 +35,24 @@ def load_keywords(filepath: str) -> list[str]:
     return keywords
 
 
+# 棋譜行判定用の正規表現（行頭の「数字 + 空白」）
+_MOVE_RE = re.compile(r'\d+\s+')
+
+# 文分割用の正規表現（句点を含めて1文ずつ切り出す）
+_SENTENCE_RE = re.compile(r'[^。]*。|[^。]+')
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_keyword_pattern(keywords: tuple[str, ...]) -> re.Pattern:
+    """キーワード群を1つの選択肢正規表現にまとめて事前コンパイルする。
+
+    キーワードごとに `in` 判定を繰り返す代わりに、1回の走査で
+    全キーワードを同時照合する。キーワードリストは実行中変わらない
+    ため、タプル化してキャッシュする。
+    """
+    return re.compile('|'.join(re.escape(k) for k in keywords))
+
+
 def is_move_line(line: str) -> bool:
     """
     棋譜行かどうか判定する。
@@ -45,7 +65,9 @@ def is_move_line(line: str) -> bool:
     Returns:
         棋譜行の場合True
     """
-    return bool(re.match(r'^\d+\s+', line.strip()))
+    # lstripだと「数字+末尾空白のみ」の行が棋譜行扱いに変わってしまう
+    # ため、従来どおりstripする
+    return _MOVE_RE.match(line.strip()) is not None
 
 
 def remove_sentences_with_keyword(line: str, keyword: str) -> str:
@@ -63,25 +85,14 @@ def remove_sentences_with_keyword(line: str, keyword: str) -> str:
     """
     if keyword not in line:
         return line
-    
-    # 句点で分割して、キーワードを含まない文のみ残す
-    sentences = re.split(r'(。)', line)
-    result = []
-    i = 0
-    while i < len(sentences):
-        sentence = sentences[i]
-        # 句点も含めて処理
-        if i + 1 < len(sentences) and sentences[i + 1] == '。':
-            sentence_with_punct = sentence + sentences[i + 1]
-            i += 2
-        else:
-            sentence_with_punct = sentence
-            i += 1
-        
-        # キーワードを含まない文のみ残す
-        if keyword not in sentence_with_punct:
-            result.append(sentence_with_punct)
-    
+
+    # 句点込みの文単位で1回走査し、キーワードを含まない文のみ残す
+    result = [
+        sentence
+        for sentence in _SENTENCE_RE.findall(line)
+        if keyword not in sentence
+    ]
+
     return ''.join(result).strip()
 
 
@@ -107,11 +118,10 @@ def contains_keyword(line: str, keywords: list[str], sentence_only_keywords: lis
     if not processed_line.strip():
         return True, ''
     
-    # 行削除キーワードのチェック
-    for keyword in keywords:
-        if keyword in processed_line:
-            return True, ''
-    
+    # 行削除キーワードのチェック（全キーワードを1回の走査で照合）
+    if keywords and _compile_keyword_pattern(tuple(keywords)).search(processed_line):
+        return True, ''
+
     return False, processed_line
 
 
@@ -140,33 +150,39 @@ def cleanse_file(
     }
     
     result_lines = []
-    
+
+    # 1行ずつのreadではなく、ファイル全体を1回のreadで取り込んで
+    # デコードも1回で済ませる（行ごとのI/O・デコードを省く）
     with open(input_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            stats['total_lines'] += 1
-            line = line.rstrip('\r\n')
-            
-            # 空行は保持
-            if not line.strip():
-                result_lines.append(line)
-                continue
-            
-            # 棋譜行は保持
-            if is_move_line(line):
-                stats['move_lines'] += 1
-                result_lines.append(line)
-                continue
-            
-            # コメント行の処理
-            should_delete, processed_line = contains_keyword(
-                line, keywords, sentence_only_keywords
-            )
-            
-            if should_delete:
-                stats['deleted_lines'] += 1
-            else:
-                stats['remaining_comment_lines'] += 1
-                result_lines.append(processed_line)
+        lines = f.read().split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()  # 末尾改行によるダミーの空要素は行として数えない
+
+    for line in lines:
+        stats['total_lines'] += 1
+        line = line.rstrip('\r')
+
+        # 空行は保持
+        if not line.strip():
+            result_lines.append(line)
+            continue
+
+        # 棋譜行は保持
+        if is_move_line(line):
+            stats['move_lines'] += 1
+            result_lines.append(line)
+            continue
+
+        # コメント行の処理
+        should_delete, processed_line = contains_keyword(
+            line, keywords, sentence_only_keywords
+        )
+
+        if should_delete:
+            stats['deleted_lines'] += 1
+        else:
+            stats['remaining_comment_lines'] += 1
+            result_lines.append(processed_line)
     
     # コメントが残らない場合はNoneを返す
     if stats['remaining_comment_lines'] == 0:
@@ -175,6 +191,27 @@ def cleanse_file(
     return result_lines, stats
 
 
+def _cleanse_one(args: tuple) -> tuple[bool, dict]:
+    """1ファイル分のクレンジングと書き出し（ワーカープロセス用）。
+
+    Args:
+        args: (入力パス, 出力パス, 行削除キーワード, 文削除キーワード)
+
+    Returns:
+        (出力ファイルを書いたか, 統計情報)
+    """
+    input_path, output_path, keywords, sentence_only_keywords = args
+
+    result, stats = cleanse_file(input_path, keywords, sentence_only_keywords)
+
+    if result is None:
+        return False, stats
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(result))
+    return True, stats
+
+
 def main():
     """メイン処理"""
     # パスの設定
@@ -207,24 +244,27 @@ def main():
     input_files = sorted(input_dir.glob('*.txt'))
     print(f"処理対象ファイル数: {len(input_files)}")
     
-    for i, input_file in enumerate(input_files):
-        if (i + 1) % 1000 == 0:
-            print(f"処理中... {i + 1}/{len(input_files)}")
-        
-        result, stats = cleanse_file(
-            str(input_file), keywords, sentence_only_keywords
-        )
-        
-        total_stats['processed_files'] += 1
-        total_stats['total_deleted_lines'] += stats['deleted_lines']
-        
-        if result is None:
-            total_stats['skipped_files'] += 1
-        else:
-            output_file = output_dir / input_file.name
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(result))
-            total_stats['output_files'] += 1
+    # ファイルごとに独立した処理なので、プロセスプールで並列化する
+    tasks = [
+        (str(input_file), str(output_dir / input_file.name),
+         keywords, sentence_only_keywords)
+        for input_file in input_files
+    ]
+
+    with Pool() as pool:
+        for i, (wrote_output, stats) in enumerate(
+            pool.imap_unordered(_cleanse_one, tasks, chunksize=64)
+        ):
+            if (i + 1) % 1000 == 0:
+                print(f"処理中... {i + 1}/{len(input_files)}")
+
+            total_stats['processed_files'] += 1
+            total_stats['total_deleted_lines'] += stats['deleted_lines']
+
+            if wrote_output:
+                total_stats['output_files'] += 1
+            else:
+                total_stats['skipped_files'] += 1
     
     # 結果の表示
     print("\n=== クレンジング完了 ===")
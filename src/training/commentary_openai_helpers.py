@@ -3,18 +3,41 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 import json
+import mmap
+import pickle
+import re
 from pathlib import Path
 
+try:  # orjsonがあれば高速なJSONパースを使う（任意依存）
+    import orjson
+except ImportError:
+    orjson = None
+
 if TYPE_CHECKING:
     from .commentary_openai_rag import RagExample
 
 
+def json_loads(s: str | bytes):
+    """JSON文字列をパースする（orjsonがあればそちらを使う）。
+
+    パース失敗時はどちらの実装でもValueError系の例外を送出する。
+    """
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
+
+
 def truncate_text(text: str, max_chars: int) -> str:
     if max_chars <= 0:
         return ""
     if len(text) <= max_chars:
         return text
-    return text[: max_chars - 1].rstrip() + "…"
+    # スライスしてからrstripすると巨大な中間文字列ができるので、
+    # 切り詰め位置から直接後退して末尾の空白を飛ばす
+    end = max_chars - 1
+    while end > 0 and text[end - 1].isspace():
+        end -= 1
+    return text[:end] + "…"
 
 
 def fmt_seconds(seconds: float) -> str:
@@ -47,6 +70,13 @@ def has_teacher_commentary_in_features(features_text: str) -> bool:
     return bool(tail.strip())
 
 
+# 盤面の1マス要約行（例: "4八: 先手金"）を抽出する正規表現
+# 行頭の空白をスキップし、「数字+漢数字」で始まりコロンを含む行にマッチする
+_SQUARE_RE = re.compile(
+    r'^[^\S\n]*([1-9][一二三四五六七八九](?=[^\n]*:)[^\n]*)', re.MULTILINE
+)
+
+
 def compact_features_text(features_text: str, max_chars: int) -> str:
     """埋め込み/プロンプト用に features_text を短縮する。
 
@@ -55,7 +85,26 @@ def compact_features_text(features_text: str, max_chars: int) -> str:
     - 「【盤面】」部分は1マス要約行を空白区切りで1行にまとめる
     - 「【シミュレーション結果】」以降の動的特徴も含める
     """
+    return compact_and_full(features_text, max_chars)[0]
+
+
+def compact_and_full(features_text: str, max_chars: int) -> tuple[str, str]:
+    """短縮テキストと教師解説除去済みフルテキストを一度に作る。
+
+    strip_teacher_commentaryとcompact_features_textを別々に呼ぶと
+    「【解説文】」マーカーの探索が二重になるため、除去を1回で
+    済ませて両方を返す。
+
+    Returns:
+        (短縮テキスト, 教師解説除去済みフルテキスト) のタプル
+    """
     text = strip_teacher_commentary(features_text)
+    compact = _compact_stripped(text, max_chars)
+    return compact, text
+
+
+def _compact_stripped(text: str, max_chars: int) -> str:
+    """教師解説除去済みテキストを短縮する（compact_features_textの本体）。"""
     if max_chars <= 0:
         return ""
 
@@ -79,23 +128,9 @@ def compact_features_text(features_text: str, max_chars: int) -> str:
         board_section = text[board_idx:]
         sim_section = ""
     
-    # 盤面の1マス要約行を抽出して空白区切りに
-    board_lines = board_section.splitlines()
-    compact_board_items: list[str] = []
-    for line in board_lines:
-        stripped = line.lstrip()
-        if not stripped:
-            continue
-        # 盤面の1マス要約行（例: "4八: 先手金"）のみ抽出
-        if (
-            len(stripped) >= 2
-            and stripped[0] in "123456789"
-            and stripped[1] in "一二三四五六七八九"
-            and ":" in stripped
-        ):
-            # "4八: 先手金" の形式をそのまま使用
-            compact_board_items.append(stripped)
-    
+    # 盤面の1マス要約行を正規表現1回でまとめて抽出する
+    compact_board_items = _SQUARE_RE.findall(board_section)
+
     # 盤面を空白区切りの1行にまとめる
     if compact_board_items:
         compact_board = board_marker + " " + " ".join(compact_board_items)
@@ -114,36 +149,71 @@ def compact_features_text(features_text: str, max_chars: int) -> str:
 
 
 def count_valid_jsonl_lines(path: Path) -> int:
+    """JSONLの有効行数を数える。
+
+    行数を数えるだけなら全行のJSONパースは不要なので、mmap上の
+    バイト走査で非空行を数える。途中書き込みで壊れている可能性が
+    あるのは末尾の行だけなので、JSONとして検証するのは最終行のみ
+    （壊れていればその1行を数えない）。
+    """
     if not path.exists():
         return 0
-    count = 0
-    with open(path, "r", encoding="utf-8") as rf:
-        for line in rf:
-            stripped = line.strip()
-            if not stripped:
-                continue
-            try:
-                json.loads(stripped)
-            except Exception:
-                break
-            count += 1
-    return count
+
+    with open(path, "rb") as rf:
+        try:
+            mm = mmap.mmap(rf.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return 0  # 空ファイル
+
+        try:
+            count = 0
+            last_line = b""
+            for line in iter(mm.readline, b""):
+                if line.strip():
+                    count += 1
+                    last_line = line
+
+            if count:
+                try:
+                    json_loads(last_line)
+                except Exception:
+                    count -= 1
+            return count
+        finally:
+            mm.close()
 
 
 def load_style_examples(jsonl_path: Path, max_count: int = 100) -> list[str]:
     """JSONLから解説文（commentary）のみを読み込む。
-    
+
+    パース結果は元ファイルのmtimeとmax_countをキーに pickle で
+    キャッシュし、2回目以降のrunではJSONL全体の走査を省く。
+
     Args:
         jsonl_path: 解説文を含むJSONLファイルのパス
         max_count: 読み込む最大件数
-    
+
     Returns:
         解説文のリスト
     """
     examples: list[str] = []
     if not jsonl_path.exists():
         return examples
-    
+
+    cache_path = jsonl_path.with_suffix(jsonl_path.suffix + ".style_cache.pkl")
+    src_mtime = jsonl_path.stat().st_mtime
+    if cache_path.exists():
+        try:
+            with open(cache_path, "rb") as cf:
+                cached = pickle.load(cf)
+            if (
+                cached.get("mtime") == src_mtime
+                and cached.get("max_count") == max_count
+            ):
+                return cached["examples"]
+        except Exception:
+            pass  # 壊れたキャッシュは作り直す
+
     with open(jsonl_path, "r", encoding="utf-8") as f:
         for line in f:
             if len(examples) >= max_count:
@@ -152,13 +222,23 @@ def load_style_examples(jsonl_path: Path, max_count: int = 100) -> list[str]:
             if not stripped:
                 continue
             try:
-                rec = json.loads(stripped)
+                rec = json_loads(stripped)
                 commentary = rec.get("commentary", "")
                 if commentary and len(commentary) >= 50:  # 短すぎるものは除外
                     examples.append(commentary)
-            except json.JSONDecodeError:
+            except ValueError:
                 continue
-    
+
+    try:
+        with open(cache_path, "wb") as cf:
+            pickle.dump(
+                {"mtime": src_mtime, "max_count": max_count, "examples": examples},
+                cf,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+    except OSError:
+        pass  # キャッシュ書き込み失敗は無視
+
     return examples
 
 
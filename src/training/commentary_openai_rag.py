@@ -1,23 +1,36 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
+import hashlib
 import json
+import sqlite3
+import threading
 import time
 from pathlib import Path
 
+import numpy as np
+
 from .commentary_openai_helpers import (
-    compact_features_text,
+    compact_and_full,
     count_valid_jsonl_lines,
     fmt_seconds,
-    strip_teacher_commentary,
+    json_loads,
     truncate_text,
 )
 from .openai_client import get_openai_client
 
 
-def embed_texts(texts: list[str], embedding_model: str) -> list[list[float]]:
-    """OpenAI embeddings をまとめて取得する。"""
+# 埋め込みリクエストの分割サイズと同時実行数の上限
+# （同時実行数がセマフォの役割を果たし、レート制限超過を防ぐ）
+_EMBED_SUBBATCH_SIZE = 256
+_EMBED_MAX_CONCURRENCY = 4
+
+
+def _embed_texts_once(texts: list[str], embedding_model: str) -> list[list[float]]:
+    """OpenAI embeddings APIを1回呼び出す。"""
     client = get_openai_client()
     resp = client.embeddings.create(
         model=embedding_model,
@@ -28,6 +41,134 @@ def embed_texts(texts: list[str], embedding_model: str) -> list[list[float]]:
     return [list(d.embedding) for d in data]
 
 
+def embed_texts(texts: list[str], embedding_model: str) -> list[list[float]]:
+    """OpenAI embeddings をまとめて取得する。
+
+    大きな入力はサブバッチに分割し、同時実行数を制限しつつ
+    並行リクエストすることでネットワーク待ちを重ねる。
+    """
+    if len(texts) <= _EMBED_SUBBATCH_SIZE:
+        return _embed_texts_once(texts, embedding_model)
+
+    chunks = [
+        texts[i:i + _EMBED_SUBBATCH_SIZE]
+        for i in range(0, len(texts), _EMBED_SUBBATCH_SIZE)
+    ]
+    with ThreadPoolExecutor(max_workers=_EMBED_MAX_CONCURRENCY) as executor:
+        chunk_results = list(
+            executor.map(
+                lambda chunk: _embed_texts_once(chunk, embedding_model), chunks
+            )
+        )
+    return [vec for chunk in chunk_results for vec in chunk]
+
+
+# 埋め込みキャッシュ
+# 同一テキスト（クエリ・教師データとも）はプロセス内メモリで、
+# runをまたいではsqliteで再利用し、OpenAIへの埋め込みリクエストを省く。
+# メモリ側はfloat32配列で保持し、上限超過時は最も古いエントリを捨てる
+# （全件はsqlite側に残るので、追い出してもAPI呼び出しは増えない）
+_EMBEDDING_CACHE_DB = Path("data") / "rag" / "rag_embedding_cache.sqlite"
+_EMBEDDING_CACHE_MAX_SIZE = 100_000
+_embedding_cache_conn: sqlite3.Connection | None = None
+_embedding_cache: "OrderedDict[tuple[str, str], np.ndarray]" = OrderedDict()
+
+# 接続はインデックス構築パイプラインのワーカースレッドと
+# 検索側のメインスレッドの両方から使われるため、
+# check_same_thread=False で作り、操作はこのロックで直列化する
+_embedding_cache_lock = threading.Lock()
+
+
+def _get_embedding_cache_conn() -> sqlite3.Connection:
+    """埋め込みキャッシュ用のsqlite接続を返す（初回に作成）。"""
+    global _embedding_cache_conn
+    with _embedding_cache_lock:
+        if _embedding_cache_conn is None:
+            _EMBEDDING_CACHE_DB.parent.mkdir(parents=True, exist_ok=True)
+            _embedding_cache_conn = sqlite3.connect(
+                _EMBEDDING_CACHE_DB, check_same_thread=False
+            )
+            _embedding_cache_conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vec BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash))"
+            )
+    return _embedding_cache_conn
+
+
+def _hash_text(text: str) -> str:
+    """キャッシュキー用のコンテンツハッシュを計算する。"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _embedding_cache_put(key: tuple[str, str], vec: np.ndarray) -> None:
+    """メモリキャッシュにエントリを追加する（上限超過時は最古を削除）。"""
+    _embedding_cache[key] = vec
+    if len(_embedding_cache) > _EMBEDDING_CACHE_MAX_SIZE:
+        _embedding_cache.popitem(last=False)
+
+
+def embed_texts_cached(texts: list[str], embedding_model: str) -> list[np.ndarray]:
+    """埋め込みをコンテンツハッシュ付きキャッシュ経由でまとめて取得する。
+
+    キャッシュに無いテキストだけを1回のAPI呼び出しで埋め込み、
+    結果をsqliteに保存する。インデックスの再構築や重複の多い
+    教師データで、OpenAI呼び出しを大幅に減らせる。
+
+    Returns:
+        各テキストに対応するfloat32の埋め込みベクトルのリスト
+    """
+    results: list[np.ndarray | None] = [None] * len(texts)
+
+    # バッチ内の同一テキストは1回だけ埋め込む（hash -> 行番号リスト）
+    miss_positions: dict[tuple[str, str], list[int]] = {}
+    miss_texts: dict[tuple[str, str], str] = {}
+
+    conn = _get_embedding_cache_conn()
+    with _embedding_cache_lock:
+        for i, text in enumerate(texts):
+            key = (embedding_model, _hash_text(text))
+            vec = _embedding_cache.get(key)
+            if vec is not None:
+                _embedding_cache.move_to_end(key)
+            else:
+                row = conn.execute(
+                    "SELECT vec FROM embeddings WHERE model = ? AND hash = ?", key
+                ).fetchone()
+                if row is not None:
+                    vec = np.frombuffer(row[0], dtype=np.float32)
+                    _embedding_cache_put(key, vec)
+            if vec is None:
+                miss_positions.setdefault(key, []).append(i)
+                miss_texts[key] = text
+            else:
+                results[i] = vec
+
+    if miss_positions:
+        miss_keys = list(miss_positions)
+        vectors = embed_texts(
+            [miss_texts[key] for key in miss_keys], embedding_model=embedding_model
+        )
+        with _embedding_cache_lock:
+            for key, vec in zip(miss_keys, vectors):
+                arr = np.asarray(vec, dtype=np.float32)
+                conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, hash, vec) VALUES (?, ?, ?)",
+                    (key[0], key[1], arr.tobytes()),
+                )
+                _embedding_cache_put(key, arr)
+                for i in miss_positions[key]:
+                    results[i] = arr
+            conn.commit()
+
+    return results
+
+
+def embed_query_cached(query_text: str, embedding_model: str) -> np.ndarray:
+    """クエリ埋め込みをコンテンツハッシュでキャッシュして取得する。"""
+    return embed_texts_cached([query_text], embedding_model=embedding_model)[0]
+
+
 @dataclass
 class RagConfig:
     enabled: bool
@@ -50,6 +191,74 @@ class RagExample:
     source_file: str | None
 
 
+class LazyRagExamples:
+    """metaファイルを遅延パースするRagExampleコンテナ。
+
+    全行を先にdataclass化すると件数×数フィールド分の文字列を
+    確保することになるが、実際に読まれるのは検索上位の数件だけ。
+    行ごとのバイトオフセットだけを先に作り、アクセスされた行だけを
+    パースして返す（結果は行番号ごとにキャッシュ）。
+    """
+
+    def __init__(self, meta_path: Path):
+        self._meta_path = meta_path
+        self._offsets = self._load_offsets()
+        self._fp = open(meta_path, "rb")
+        self._cache: dict[int, RagExample] = {}
+
+    def _load_offsets(self):
+        """各レコード行のバイトオフセットを取得する（.offsets.npyにキャッシュ）。
+
+        キャッシュの先頭要素にはmetaファイルのバイトサイズを記録し、
+        追記などでサイズが変わっていたら作り直す（mtimeは分解能が
+        粗く、追記直後の再ロードを検出できないため使わない）。
+        """
+        offsets_path = self._meta_path.with_suffix(
+            self._meta_path.suffix + ".offsets.npy"
+        )
+        meta_size = self._meta_path.stat().st_size
+
+        if offsets_path.exists():
+            cached = np.load(offsets_path)
+            if cached.size >= 1 and int(cached[0]) == meta_size:
+                return cached[1:]
+
+        offsets: list[int] = []
+        pos = 0
+        with open(self._meta_path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    offsets.append(pos)
+                pos += len(line)
+
+        arr = np.asarray([meta_size] + offsets, dtype=np.int64)
+        try:
+            np.save(offsets_path, arr)
+        except OSError:
+            pass  # キャッシュ書き込み失敗は無視（次回再計算）
+        return arr[1:]
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> RagExample:
+        cached = self._cache.get(index)
+        if cached is not None:
+            return cached
+
+        self._fp.seek(int(self._offsets[index]))
+        m = json_loads(self._fp.readline())
+        example = RagExample(
+            sfen=str(m.get("sfen", "")),
+            features_text=str(m.get("features_text", "")),
+            features_text_full=str(m.get("features_text_full", m.get("features_text", ""))),
+            commentary=str(m.get("commentary", "")),
+            source_file=m.get("source_file"),
+        )
+        self._cache[index] = example
+        return example
+
+
 def rag_paths(index_base: Path) -> tuple[Path, Path, Path]:
     # base を "idx" などにしておけば、idx.npz / idx.meta.jsonl / idx.info.json ができる
     return (
@@ -59,6 +268,23 @@ def rag_paths(index_base: Path) -> tuple[Path, Path, Path]:
     )
 
 
+def _embeddings_npy_path(index_base: Path) -> Path:
+    """mmapロード用の非圧縮埋め込みファイル（.npy）のパスを返す。"""
+    return index_base.with_suffix(index_base.suffix + ".embeddings.npy")
+
+
+def _load_embeddings_npz(npz_path: Path):
+    """npzから埋め込み行列を読み込む。
+
+    int8量子化形式（embeddings_q + scale）と旧来のFP32形式
+    （embeddings）の両方に対応し、FP32の行列を返す。
+    """
+    with np.load(npz_path) as z:
+        if "embeddings_q" in z:
+            return z["embeddings_q"].astype(np.float32) / float(z["scale"])
+        return z["embeddings"].astype(np.float32)
+
+
 def build_rag_index(
     examples_jsonl: Path,
     index_base: Path,
@@ -71,8 +297,6 @@ def build_rag_index(
 ) -> None:
     """教師データJSONLから埋め込みインデックスを作る。"""
 
-    import numpy as np  # 遅延import
-
     npz_path, meta_path, info_path = rag_paths(index_base)
     index_base.parent.mkdir(parents=True, exist_ok=True)
 
@@ -81,8 +305,7 @@ def build_rag_index(
     start = 0
     if resume and npz_path.exists() and meta_path.exists():
         try:
-            with np.load(npz_path) as z:
-                existing_embeddings = z["embeddings"].astype(np.float32)
+            existing_embeddings = _load_embeddings_npz(npz_path)
             start = count_valid_jsonl_lines(meta_path)
             if existing_embeddings.shape[0] != start:
                 raise ValueError(
@@ -101,26 +324,36 @@ def build_rag_index(
     last_report = start
     start_time = time.time()
 
-    def flush_batch() -> None:
-        nonlocal written, batch_texts, batch_meta, last_report, start_time
-        if not batch_texts:
-            return
-        vectors = embed_texts(batch_texts, embedding_model=embedding_model)
+    # metaファイルはバッチごとに開き直さず、run全体で1つのハンドルを使う。
+    # flushは進捗報告のタイミングだけに抑える
+    meta_fp = open(meta_path, "a" if start > 0 else "w", encoding="utf-8")
+
+    # 埋め込みAPIの待ち時間と次バッチのJSONL読み込み・整形を重ねる
+    # パイプライン。ワーカーを1本にすることで embeddings / meta の
+    # 順序は入力順のまま保たれる（深さ2でバックプレッシャを掛ける）
+    pipeline = ThreadPoolExecutor(max_workers=1)
+    in_flight: deque[Future] = deque()
+
+    def _process_batch(batch_texts: list[str], batch_meta: list[dict]) -> None:
+        nonlocal written, last_report
+        vectors = embed_texts_cached(batch_texts, embedding_model=embedding_model)
         arr = np.asarray(vectors, dtype=np.float32)
         norms = np.linalg.norm(arr, axis=1, keepdims=True)
         arr = arr / np.maximum(norms, 1e-12)
         embeddings_chunks.append(arr)
 
         # metaは追記（1行=1例、embeddingsと行番号が一致）
-        meta_mode = "a" if (start > 0 or written > 0) else "w"
-        with open(meta_path, meta_mode, encoding="utf-8", buffering=1) as wf:
-            for m in batch_meta:
-                wf.write(json.dumps(m, ensure_ascii=False) + "\n")
+        # バッチ全体を1つの文字列にまとめて1回のwriteで書き出す
+        payload = "\n".join(
+            json.dumps(m, ensure_ascii=False) for m in batch_meta
+        ) + "\n"
+        meta_fp.write(payload)
 
         written += len(batch_texts)
         if progress_every > 0:
             total_done = start + written
             if total_done - last_report >= progress_every:
+                meta_fp.flush()
                 elapsed = max(1e-6, time.time() - start_time)
                 done_since_start = max(1, total_done - start)
                 rate = done_since_start / elapsed
@@ -133,63 +366,87 @@ def build_rag_index(
                     flush=True,
                 )
                 last_report = total_done
+
+    def flush_batch() -> None:
+        nonlocal batch_texts, batch_meta
+        if not batch_texts:
+            return
+        while len(in_flight) >= 2:
+            in_flight.popleft().result()
+        in_flight.append(pipeline.submit(_process_batch, batch_texts, batch_meta))
         batch_texts = []
         batch_meta = []
 
-    with open(examples_jsonl, "r", encoding="utf-8") as rf:
-        for i, line in enumerate(rf):
-            if i < start:
-                continue
-            raw = line.strip()
-            if not raw:
-                continue
-            try:
-                rec = json.loads(raw)
-            except Exception:
-                continue
-
-            features_text = rec.get("features_text", "")
-            commentary = rec.get("commentary", "")
-            if not features_text or not commentary:
-                continue
-
-            # 教師解説を除去したフルテキスト
-            features_text_full = strip_teacher_commentary(features_text)
-            # 埋め込み用に短縮
-            compact = compact_features_text(features_text, max_chars=max_feature_chars)
-            if not compact:
-                continue
-
-            batch_texts.append(compact)
-            batch_meta.append(
-                {
-                    "sfen": rec.get("sfen", ""),
-                    "features_text": compact,
-                    "features_text_full": features_text_full,
-                    "commentary": truncate_text(str(commentary), max_example_commentary_chars),
-                    "source_file": rec.get("source_file"),
-                }
-            )
+    try:
+        with open(examples_jsonl, "r", encoding="utf-8") as rf:
+            for i, line in enumerate(rf):
+                if i < start:
+                    continue
+                raw = line.strip()
+                if not raw:
+                    continue
+                try:
+                    rec = json_loads(raw)
+                except Exception:
+                    continue
+
+                features_text = rec.get("features_text", "")
+                commentary = rec.get("commentary", "")
+                if not features_text or not commentary:
+                    continue
+
+                # 埋め込み用の短縮テキストと教師解説除去済みフルテキストを
+                # 1回の走査でまとめて作る
+                compact, features_text_full = compact_and_full(
+                    features_text, max_chars=max_feature_chars
+                )
+                if not compact:
+                    continue
+
+                batch_texts.append(compact)
+                batch_meta.append(
+                    {
+                        "sfen": rec.get("sfen", ""),
+                        "features_text": compact,
+                        "features_text_full": features_text_full,
+                        "commentary": truncate_text(str(commentary), max_example_commentary_chars),
+                        "source_file": rec.get("source_file"),
+                    }
+                )
 
-            if len(batch_texts) >= batch_size:
-                flush_batch()
+                if len(batch_texts) >= batch_size:
+                    flush_batch()
 
-    flush_batch()
+        flush_batch()
+        while in_flight:
+            in_flight.popleft().result()
+    finally:
+        pipeline.shutdown(wait=True)
+        meta_fp.close()
 
-    if existing_embeddings is not None:
-        new_emb = (
-            np.concatenate(embeddings_chunks, axis=0)
-            if embeddings_chunks
-            else np.empty((0, existing_embeddings.shape[1]), dtype=np.float32)
-        )
-        embeddings = np.concatenate([existing_embeddings, new_emb], axis=0)
-    else:
-        embeddings = np.concatenate(embeddings_chunks, axis=0) if embeddings_chunks else None
+    # L2正規化はflush_batch内でチャンク単位に済んでいるので、
+    # ここでは既存分と新規チャンクを1回のconcatenateにまとめるだけ
+    # （既存+新規を2段階で連結すると中間配列の分だけピークが増える）
+    all_chunks = (
+        [existing_embeddings] if existing_embeddings is not None else []
+    ) + embeddings_chunks
 
-    if embeddings is None or embeddings.shape[0] == 0:
+    if not all_chunks:
         raise RuntimeError("RAGインデックスを作れませんでした（有効データ0件）")
 
-    np.savez_compressed(npz_path, embeddings=embeddings)
+    embeddings = np.concatenate(all_chunks, axis=0)
+    if embeddings.shape[0] == 0:
+        raise RuntimeError("RAGインデックスを作れませんでした（有効データ0件）")
+
+    # 単位ノルム化済みベクトルはint8量子化に頑健なので、対称スケールで
+    # 量子化して保存する（保存サイズとロード帯域が約1/4になる）
+    scale = 127.0
+    embeddings_q = np.clip(np.round(embeddings * scale), -127, 127).astype(np.int8)
+    np.savez_compressed(npz_path, embeddings_q=embeddings_q, scale=np.float32(scale))
+
+    # mmapロード用に非圧縮のFP32版も書いておく。ロード時はこちらを
+    # メモリマップで開き、全量をRAMに展開せずに類似度計算へ流す
+    np.save(_embeddings_npy_path(index_base), embeddings)
     info = {
         "embedding_model": embedding_model,
         "count": int(embeddings.shape[0]),
@@ -206,34 +463,19 @@ def build_rag_index(
 
 
 def load_rag_index(index_base: Path):
-    import numpy as np  # 遅延import
-
     npz_path, meta_path, _info_path = rag_paths(index_base)
-    if not npz_path.exists() or not meta_path.exists():
+    npy_path = _embeddings_npy_path(index_base)
+    if (not npz_path.exists() and not npy_path.exists()) or not meta_path.exists():
         raise FileNotFoundError(f"RAGインデックスが見つかりません: {npz_path} / {meta_path}")
 
-    with np.load(npz_path) as z:
-        embeddings = z["embeddings"].astype(np.float32)
-
-    examples: list[RagExample] = []
-    with open(meta_path, "r", encoding="utf-8") as rf:
-        for line in rf:
-            raw = line.strip()
-            if not raw:
-                continue
-            try:
-                m = json.loads(raw)
-            except Exception:
-                continue
-            examples.append(
-                RagExample(
-                    sfen=str(m.get("sfen", "")),
-                    features_text=str(m.get("features_text", "")),
-                    features_text_full=str(m.get("features_text_full", m.get("features_text", ""))),
-                    commentary=str(m.get("commentary", "")),
-                    source_file=m.get("source_file"),
-                )
-            )
+    if npy_path.exists():
+        # 非圧縮npyはメモリマップで開き、必要なページだけOSに読ませる
+        embeddings = np.load(npy_path, mmap_mode="r")
+    else:
+        embeddings = _load_embeddings_npz(npz_path)
+
+    # metaは遅延パース（検索でヒットした行だけdataclass化する）
+    examples = LazyRagExamples(meta_path)
 
     if embeddings.shape[0] != len(examples):
         raise ValueError(f"RAGインデックス不整合: embeddings={embeddings.shape[0]}, meta={len(examples)}")
@@ -249,20 +491,70 @@ def retrieve_rag_examples(
     top_k: int,
     exclude_sfen: str | None,
 ) -> list[RagExample]:
-    import numpy as np  # 遅延import
-
-    vec = embed_texts([query_features_text], embedding_model=embedding_model)[0]
+    vec = embed_query_cached(query_features_text, embedding_model=embedding_model)
     q = np.asarray(vec, dtype=np.float32)
     q = q / max(float(np.linalg.norm(q)), 1e-12)
     sims = embeddings @ q
 
+    return _select_top_examples(sims, examples, top_k, exclude_sfen)
+
+
+def retrieve_rag_examples_batch(
+    query_features_texts: list[str],
+    embeddings,
+    examples: list[RagExample],
+    embedding_model: str,
+    top_k: int,
+    exclude_sfens: list[str | None] | None = None,
+) -> list[list[RagExample]]:
+    """複数クエリの類似例をまとめて取得する。
+
+    クエリ埋め込みを1回のAPI呼び出しに集約し、類似度計算も
+    1回の行列積で行う。hnswlib等の近似近傍ライブラリは本ツリーの
+    依存に含まれないため、照合は密な内積のまま行う。
+
+    Args:
+        query_features_texts: クエリ局面特徴のリスト
+        exclude_sfens: クエリごとの除外SFEN（Noneなら除外なし）
+
+    Returns:
+        各クエリに対応する類似例リストのリスト（入力と同順）
+    """
+    if not query_features_texts:
+        return []
+
+    vecs = embed_texts(query_features_texts, embedding_model=embedding_model)
+    queries = np.asarray(vecs, dtype=np.float32)
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = queries / np.maximum(norms, 1e-12)
+
+    # (N, dim) @ (dim, B) -> (N, B) を1回のGEMMで計算する
+    sims_all = embeddings @ queries.T
+
+    results: list[list[RagExample]] = []
+    for j in range(len(query_features_texts)):
+        exclude_sfen = exclude_sfens[j] if exclude_sfens else None
+        results.append(
+            _select_top_examples(sims_all[:, j], examples, top_k, exclude_sfen)
+        )
+    return results
+
+
+def _select_top_examples(
+    sims,
+    examples: list[RagExample],
+    top_k: int,
+    exclude_sfen: str | None,
+) -> list[RagExample]:
+    """類似度ベクトルから上位k件の例を選ぶ。"""
     k = max(0, int(top_k))
     if k <= 0:
         return []
     k = min(k, int(sims.shape[0]))
 
-    idxs = np.argpartition(sims, -k)[-k:]
-    idxs = idxs[np.argsort(-sims[idxs])]
+    # 上位k件だけを取り出してから降順に並べ替える（負値配列の生成を避ける）
+    part = np.argpartition(sims, -k)[-k:]
+    idxs = part[np.argsort(sims[part])[::-1]]
 
     out: list[RagExample] = []
     for ix in idxs.tolist():
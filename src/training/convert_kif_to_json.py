@@ -6,135 +6,380 @@ KIF形式のコメント付き棋譜をJSON形式に変換するスクリプト
 その局面に対するコメントのペアをJSON形式で出力する。
 """
 
+import argparse
+import atexit
 import json
-import re
+import logging
+import mmap
+import os
 import sys
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import Pool
 from pathlib import Path
 
+try:  # orjsonがあれば高速なJSONエンコードを使う（任意依存）
+    import orjson
+except ImportError:
+    orjson = None
+
 # プロジェクトルートをパスに追加
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from cshogi import Board
 from src.utils.KIF_to_usi import kif_move_to_usi
 
+logger = logging.getLogger(__name__)
+
+
+# 変換結果の1件分。dictと違いハッシュテーブルを持たないため、
+# コメントの多い棋譜でもメモリ使用量を抑えられる
+Entry = namedtuple('Entry', ('sfen', 'comment', 'move_number'))
+
+# 棋譜行として扱わない終局表示
+_TERMINATORS = frozenset(('投了', '持将棋', '千日手', '中断'))
+
 
 def is_move_line(line: str) -> tuple[bool, int | None, str | None]:
     """
     行が棋譜行かどうか判定する。
 
+    パターンが「数字 + 空白 + 残り」と単純なので、正規表現エンジンを
+    使わず先頭文字の判定と1回のsplitで済ませる。
+
     Args:
-        line: 判定対象の行
+        line: 判定対象の行（呼び出し元でstrip済みであること）
 
     Returns:
         (is_move, move_number, move_str): 棋譜行の場合は(True, 手数, 指し手)、
         そうでなければ(False, None, None)
     """
-    match = re.match(r'^(\d+)\s+(.+)$', line.strip())
-    if match:
-        move_num = int(match.group(1))
-        move_str = match.group(2).strip()
-        # 「投了」などは棋譜行として扱わない
-        if move_str in ('投了', '持将棋', '千日手', '中断'):
-            return False, None, None
-        return True, move_num, move_str
-    return False, None, None
-
-
-def parse_kif_with_comments(filepath: str) -> list[dict]:
+    stripped = line
+    if not stripped or not stripped[0].isdigit():
+        return False, None, None
+
+    parts = stripped.split(None, 1)
+    if len(parts) != 2:
+        return False, None, None
+
+    try:
+        move_num = int(parts[0])
+    except ValueError:
+        return False, None, None
+
+    move_str = parts[1].strip()
+    # 「投了」などは棋譜行として扱わない
+    if move_str in _TERMINATORS:
+        return False, None, None
+    return True, move_num, move_str
+
+
+def parse_kif_with_comments(filepath: str, board: Board | None = None) -> list[Entry]:
     """
     KIFファイルを読み込み、コメント付き局面のリストを返す。
 
     Args:
         filepath: KIFファイルのパス
+        board: 使い回すBoardオブジェクト（省略時は新規作成）
 
     Returns:
-        コメント付き局面のリスト。各エントリは:
-        {"sfen": "...", "comment": "...", "move_number": N}
+        コメント付き局面（Entry namedtuple）のリスト。
+        各エントリは (sfen, comment, move_number)
     """
-    with open(filepath, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+    return list(iter_kif_with_comments(filepath, board=board))
+
 
-    board = Board()
-    results = []
+def iter_kif_with_comments(filepath: str, board: Board | None = None):
+    """
+    KIFファイルからコメント付き局面を1件ずつ生成する。
+
+    リストを返すparse_kif_with_commentsと違い、エントリを順に
+    yieldするため、コメントの多い棋譜でもピークメモリが増えない。
+
+    Args:
+        filepath: KIFファイルのパス
+        board: 使い回すBoardオブジェクト（省略時は新規作成）。
+            バッチ変換ではファイルごとのBoard生成を省くため、
+            呼び出し元が1つのBoardをreset()しながら渡す
+
+    Yields:
+        Entry: コメント付き局面（sfen, comment, move_number）
+    """
+    if board is None:
+        board = Board()
+    else:
+        board.reset()
     last_to_square = None
-    current_sfen = None
+    has_position = False  # 直前の指し手が正常に適用できているか
     current_move_num = 0
     pending_comments = []
 
-    for line in lines:
-        line = line.rstrip('\r\n')
-
-        is_move, move_num, move_str = is_move_line(line)
-
+    # 先に全行の棋譜行判定だけを済ませる。コメント行が1つもない
+    # ファイルは盤面再生もSFEN生成もせずに即終了できる。
+    # 判定はバイト列のまま行い、デコードは指し手部分とコメント行に
+    # 限定する（棋譜行が大半を占めるのでデコード量が大きく減る）
+    # 大きいファイルはmmapで読み、バッファI/Oの状態管理とコピーを省く
+    with open(filepath, 'rb') as f:
+        if os.path.getsize(filepath) > 64 * 1024:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                data = bytes(mm)
+        else:
+            data = f.read()
+
+    parsed: list[tuple[tuple, str | None]] = []
+    has_comment = False
+    for raw in data.split(b'\n'):
+        braw = raw.strip()
+        if not braw:
+            continue
+
+        # バイト先頭がASCII数字なら棋譜行の可能性が高い
+        move_entry = None
+        if braw[:1].isdigit():
+            parts = braw.split(None, 1)
+            if len(parts) == 2 and parts[0].isdigit():
+                move_str = parts[1].decode('utf-8').strip()
+                if move_str not in _TERMINATORS:
+                    move_entry = (True, int(parts[0]), move_str)
+
+        if move_entry is not None:
+            parsed.append((move_entry, None))
+            continue
+
+        # バイト判定で確定できなかった行（コメント、終局表示、全角数字
+        # 始まりなど）はデコードして従来どおり判定する
+        stripped = braw.decode('utf-8').strip()
+        if not stripped:
+            continue
+        move_entry = is_move_line(stripped)
+        parsed.append((move_entry, stripped))
+        if not move_entry[0]:
+            has_comment = True
+
+    if not has_comment:
+        return
+
+    for (is_move, move_num, move_str), stripped in parsed:
         if is_move:
             # 前の指し手にコメントがあれば保存
-            if current_sfen and pending_comments:
-                results.append({
-                    'sfen': current_sfen,
-                    'comment': '\n'.join(pending_comments),
-                    'move_number': current_move_num
-                })
+            # SFENの生成はコメントが付く局面に限る（盤面はまだ
+            # 直前の指し手の状態なので、ここで遅延生成できる）
+            if has_position and pending_comments:
+                # コメントが1件だけならjoinを省く
+                if len(pending_comments) == 1:
+                    comment = pending_comments[0]
+                else:
+                    comment = '\n'.join(pending_comments)
+                yield Entry(board.sfen(), comment, current_move_num)
             pending_comments = []
 
             # 指し手を処理
             try:
                 usi_move, to_square = kif_move_to_usi(move_str, last_to_square)
                 board.push_usi(usi_move)
-                current_sfen = board.sfen()
                 current_move_num = move_num
                 last_to_square = to_square
+                has_position = True
             except ValueError as e:
                 # 変換エラーの場合はスキップ
-                print(f"警告 ({filepath}): {e}")
-                current_sfen = None
+                # printはワーカープロセス間でstdoutを奪い合うため、
+                # バッファリングされるloggingに流す
+                logger.warning("警告 (%s): %s", filepath, e)
+                has_position = False
             except Exception as e:
                 # cshogiのエラー（不正な手など）
-                print(f"警告 ({filepath}): 手 '{move_str}' を適用できません: {e}")
-                current_sfen = None
+                logger.warning(
+                    "警告 (%s): 手 '%s' を適用できません: %s", filepath, move_str, e
+                )
+                has_position = False
         else:
-            # コメント行（空行でない場合）
-            if line.strip():
-                pending_comments.append(line.strip())
+            # コメント行（空行は事前スキャンで除外済み）
+            pending_comments.append(stripped)
 
     # 最後の指し手にコメントがあれば保存
-    if current_sfen and pending_comments:
-        results.append({
-            'sfen': current_sfen,
-            'comment': '\n'.join(pending_comments),
-            'move_number': current_move_num
-        })
-
-    return results
+    if has_position and pending_comments:
+        if len(pending_comments) == 1:
+            comment = pending_comments[0]
+        else:
+            comment = '\n'.join(pending_comments)
+        yield Entry(board.sfen(), comment, current_move_num)
 
 
-def convert_file(input_path: Path, output_path: Path) -> dict:
+def convert_file(
+    input_path: Path, output_path: Path, board: Board | None = None
+) -> dict:
     """
     1つのKIFファイルをJSONに変換する。
 
     Args:
         input_path: 入力KIFファイルのパス
         output_path: 出力JSONファイルのパス
+        board: 使い回すBoardオブジェクト（省略時は新規作成）
 
     Returns:
         統計情報の辞書
     """
-    results = parse_kif_with_comments(str(input_path))
-
-    stats = {
-        'comment_count': len(results),
-        'converted': len(results) > 0
+    # エントリを全件リスト化せず、生成されたそばから書き出す
+    count = 0
+    writer = None
+    try:
+        for entry in iter_kif_with_comments(str(input_path), board=board):
+            if writer is None:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                writer = open(output_path, 'wb')
+                writer.write(b'[\n')
+            else:
+                writer.write(b',\n')
+            writer.write(_encode_entry(entry))
+            count += 1
+
+        if writer is not None:
+            writer.write(b'\n]')
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return {
+        'comment_count': count,
+        'converted': count > 0
     }
 
-    if results:
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
 
-    return stats
+def _encode_entry(entry: Entry) -> bytes:
+    """1エントリをJSON配列の要素としてインデント付きでエンコードする。"""
+    if orjson is not None:
+        text = orjson.dumps(entry._asdict(), option=orjson.OPT_INDENT_2).decode('utf-8')
+    else:
+        text = json.dumps(entry._asdict(), ensure_ascii=False, indent=2)
+    return '\n'.join('  ' + line for line in text.splitlines()).encode('utf-8')
+
+
+# このプロセスで書き込み済みのシャードパス。初回の書き込みは上書きで
+# 開き、前回runの残骸（PID再利用時の古いシャード含む）を引き継がない
+_opened_shards: set[Path] = set()
+
+
+def _append_jsonl_shard(output_dir: Path, source_name: str, results: list[Entry]) -> None:
+    """変換結果をワーカー専用のJSONLシャードへ追記する。
+
+    ファイル単位の小さなJSONを大量に作るとinode更新などの
+    メタデータ書き込みがボトルネックになるため、プロセスごとに
+    1つのシャードファイルへ追記する（ロック不要）。
+    """
+    shard_path = output_dir / f"shard-{os.getpid()}.jsonl"
+    first_write = shard_path not in _opened_shards
+    records = [
+        {'source_file': source_name, **entry._asdict()} for entry in results
+    ]
+    if orjson is not None:
+        payload = b'\n'.join(orjson.dumps(rec) for rec in records) + b'\n'
+        with open(shard_path, 'wb' if first_write else 'ab') as f:
+            f.write(payload)
+    else:
+        payload = '\n'.join(
+            json.dumps(rec, ensure_ascii=False) for rec in records
+        ) + '\n'
+        with open(shard_path, 'w' if first_write else 'a', encoding='utf-8') as f:
+            f.write(payload)
+    _opened_shards.add(shard_path)
+
+
+def _write_json(output_path: Path, results: list[Entry]) -> None:
+    """変換結果をJSONファイルに書き出す。"""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    records = [entry._asdict() for entry in results]
+    if orjson is not None:
+        # C実装のエンコーダで一括エンコードして1回で書き出す
+        output_path.write_bytes(orjson.dumps(records, option=orjson.OPT_INDENT_2))
+    else:
+        # json.dump(f)は細切れのwriteを繰り返すので、
+        # 一括エンコードしてから1回のwriteで書き出す
+        buf = json.dumps(records, ensure_ascii=False, indent=2).encode('utf-8')
+        output_path.write_bytes(buf)
+
+
+# ワーカープロセスごとに使い回すBoardと書き出しスレッド
+_worker_board: Board | None = None
+_worker_write_executor: ThreadPoolExecutor | None = None
+_pending_write: Future | None = None
+
+
+def _init_worker() -> None:
+    """ワーカープロセスの初期化（使い回すBoardと書き出しスレッドを確保）。"""
+    global _worker_board, _worker_write_executor
+    _worker_board = Board()
+    _worker_write_executor = ThreadPoolExecutor(max_workers=2)
+    atexit.register(_drain_pending_write)
+
+
+def _drain_pending_write() -> None:
+    """実行中の書き出しを待ち、スレッドを終了する（ワーカー終了時）。"""
+    global _pending_write, _worker_write_executor
+    if _pending_write is not None:
+        _pending_write.result()
+        _pending_write = None
+    if _worker_write_executor is not None:
+        _worker_write_executor.shutdown(wait=True)
+        _worker_write_executor = None
+
+
+def _worker(args: tuple) -> dict:
+    """1ファイル分の変換（ワーカープロセス用）。
+
+    JSONの書き出しはサイドカースレッドに任せ、次ファイルのパースと
+    ディスクI/Oを重ねる（深さ1のパイプライン。書き出しエラーは
+    次のファイルの処理時に表面化する）。
+
+    Args:
+        args: (入力KIFパス, 出力JSONパス) のタプル
+
+    Returns:
+        統計情報の辞書（エラー時は {'error': メッセージ}）
+    """
+    global _pending_write
+    input_path, output_target, use_jsonl = args
+    try:
+        if _pending_write is not None:
+            _pending_write.result()
+            _pending_write = None
+
+        results = parse_kif_with_comments(str(input_path), board=_worker_board)
+        stats = {
+            'comment_count': len(results),
+            'converted': len(results) > 0
+        }
+
+        if results:
+            if use_jsonl:
+                write_fn, write_args = _append_jsonl_shard, (
+                    output_target, input_path.stem, results
+                )
+            else:
+                write_fn, write_args = _write_json, (output_target, results)
+
+            if _worker_write_executor is not None:
+                _pending_write = _worker_write_executor.submit(write_fn, *write_args)
+            else:
+                write_fn(*write_args)
+
+        return stats
+    except Exception as e:
+        return {'error': f"エラー ({input_path}): {e}"}
 
 
 def main():
     """メイン処理"""
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    parser = argparse.ArgumentParser(description='KIF形式のコメント付き棋譜をJSONに変換する')
+    parser.add_argument(
+        '--jsonl-shards',
+        action='store_true',
+        help='ファイル単位のJSONではなく、ワーカーごとのJSONLシャードに出力する'
+        '（大量の小ファイル作成によるファイルシステム負荷を避けたい場合）',
+    )
+    args = parser.parse_args()
+
     # パスの設定
     base_dir = Path(__file__).parent.parent
     input_dir = base_dir / 'data' / 'kif_commentary_cleaned'
@@ -152,17 +397,40 @@ def main():
     }
 
     # 全ファイルの処理
-    input_files = sorted(input_dir.glob('*.txt'))
+    # Path.globはエントリごとにPathオブジェクトを生成するため、
+    # os.scandirでファイル名だけを列挙してからPath化する
+    with os.scandir(input_dir) as it:
+        input_names = sorted(
+            entry.name
+            for entry in it
+            if entry.name.endswith('.txt') and entry.is_file(follow_symlinks=False)
+        )
+    input_files = [input_dir / name for name in input_names]
     print(f"処理対象ファイル数: {len(input_files)}")
 
-    for i, input_file in enumerate(input_files):
-        if (i + 1) % 1000 == 0:
-            print(f"処理中... {i + 1}/{len(input_files)}")
-
-        output_file = output_dir / f"{input_file.stem}.json"
+    # ファイルごとに独立した変換なので、プロセスプールで並列化する
+    if args.jsonl_shards:
+        tasks = [(input_file, output_dir, True) for input_file in input_files]
+    else:
+        tasks = [
+            (input_file, output_dir / f"{input_file.stem}.json", False)
+            for input_file in input_files
+        ]
+
+    # withブロックの__exit__はterminate()でワーカーをSIGTERMするため、
+    # 書き出しスレッドのatexitドレインが走らず最後のファイルが失われる。
+    # close()+join()でワーカーを正常終了させる
+    pool = Pool(os.cpu_count(), initializer=_init_worker)
+    try:
+        for i, stats in enumerate(pool.imap_unordered(_worker, tasks, chunksize=64)):
+            if (i + 1) % 1000 == 0:
+                print(f"処理中... {i + 1}/{len(input_files)}")
+
+            if 'error' in stats:
+                print(stats['error'])
+                total_stats['skipped_files'] += 1
+                continue
 
-        try:
-            stats = convert_file(input_file, output_file)
             total_stats['processed_files'] += 1
             total_stats['total_comments'] += stats['comment_count']
 
@@ -170,9 +438,9 @@ def main():
                 total_stats['output_files'] += 1
             else:
                 total_stats['skipped_files'] += 1
-        except Exception as e:
-            print(f"エラー ({input_file}): {e}")
-            total_stats['skipped_files'] += 1
+    finally:
+        pool.close()
+        pool.join()
 
     # 結果の表示
     print("\n=== 変換完了 ===")
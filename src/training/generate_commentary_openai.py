@@ -24,71 +24,47 @@ r"""OpenAI APIで将棋の解説文（コメント）を生成する。
 from __future__ import annotations
 
 import argparse
+import asyncio
 import json
 import os
 import random
+import re
 import time
 from dataclasses import dataclass
 from pathlib import Path
 
-
-def _truncate(text: str, max_chars: int) -> str:
-    if max_chars <= 0:
-        return ""
-    if len(text) <= max_chars:
-        return text
-    return text[: max_chars - 1].rstrip() + "…"
-
-
-def _fmt_seconds(seconds: float) -> str:
-    seconds = max(0.0, float(seconds))
-    m, s = divmod(int(seconds + 0.5), 60)
-    h, m = divmod(m, 60)
-    if h:
-        return f"{h:d}時間{m:02d}分{s:02d}秒"
-    if m:
-        return f"{m:d}分{s:02d}秒"
-    return f"{s:d}秒"
-
-
-def _strip_teacher_commentary(features_text: str) -> str:
-    """features_text から教師の解説文セクションを除去する。"""
-    marker = "【解説文】"
-    idx = features_text.find(marker)
-    if idx == -1:
-        return features_text
-    return features_text[:idx].rstrip()
-
-
-def _has_teacher_commentary_in_features(features_text: str) -> bool:
-    """features_text 内に教師解説（【解説文】以降の非空テキスト）が含まれるか。"""
-    marker = "【解説文】"
-    idx = features_text.find(marker)
-    if idx == -1:
-        return False
-    tail = features_text[idx + len(marker) :]
-    return bool(tail.strip())
-
-
-# _compact_features_text は commentary_openai_helpers から使用
-from src.training.commentary_openai_helpers import compact_features_text as _compact_features_text
-
-
-def count_valid_jsonl_lines(path: Path) -> int:
-    if not path.exists():
-        return 0
-    count = 0
-    with open(path, 'r', encoding='utf-8') as rf:
-        for line in rf:
-            stripped = line.strip()
-            if not stripped:
-                continue
-            try:
-                json.loads(stripped)
-            except Exception:
-                break
-            count += 1
-    return count
+try:  # orjsonがあれば高速なJSONエンコードを使う（任意依存）
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# 共通ヘルパー（以前はこのファイルに重複実装があったが、
+# commentary_openai_helpers / commentary_openai_rag に集約した）
+from src.training.commentary_openai_helpers import (
+    compact_and_full as _compact_and_full,
+    count_valid_jsonl_lines,
+    fmt_seconds as _fmt_seconds,
+    has_teacher_commentary_in_features as _has_teacher_commentary_in_features,
+    make_prompt,
+    strip_teacher_commentary as _strip_teacher_commentary,
+)
+from src.training.commentary_openai_rag import (
+    RagConfig,
+    RagExample,
+    build_rag_index,
+    load_rag_index,
+    rag_paths as _rag_paths,
+    retrieve_rag_examples,
+)
+from src.training.openai_client import (
+    close_async_openai_client,
+    get_async_openai_client,
+    get_openai_client,
+)
+from src.utils.KIF_to_usi import usi_move_to_kif
+
+import cshogi
 
 
 @dataclass
@@ -98,22 +74,6 @@ class OpenAIConfig:
     max_output_tokens: int
 
 
-# make_prompt は commentary_openai_helpers から使用
-from src.training.commentary_openai_helpers import make_prompt
-
-
-def get_openai_client():
-    """openai>=1.x を想定。"""
-    try:
-        from openai import OpenAI  # type: ignore
-    except Exception as e:
-        raise ImportError(
-            "openai パッケージが見つかりません。requirementsのopenaiを .venv にインストールしてください。"
-        ) from e
-
-    return OpenAI()
-
-
 def call_openai(system: str, user: str, cfg: OpenAIConfig) -> tuple[str, dict]:
     client = get_openai_client()
 
@@ -136,274 +96,40 @@ def call_openai(system: str, user: str, cfg: OpenAIConfig) -> tuple[str, dict]:
     return text, meta
 
 
-def _embed_texts(texts: list[str], embedding_model: str) -> list[list[float]]:
-    """OpenAI embeddings をまとめて取得する。"""
-    client = get_openai_client()
-    resp = client.embeddings.create(
-        model=embedding_model,
-        input=texts,
-    )
-    data = list(getattr(resp, "data", []) or [])
-    data.sort(key=lambda d: getattr(d, "index", 0))
-    return [list(d.embedding) for d in data]
-
+# KIF変換用のスクラッチ盤面（呼び出しごとのBoard生成を避ける）
+_kif_board: cshogi.Board | None = None
 
-@dataclass
-class RagConfig:
-    enabled: bool
-    examples_jsonl: Path | None
-    index_base: Path | None
-    embedding_model: str
-    top_k: int
-    max_feature_chars: int
-    max_example_commentary_chars: int
-    batch_size: int
-    progress_every: int
 
+async def call_openai_async(system: str, user: str, cfg: OpenAIConfig) -> tuple[str, dict]:
+    """call_openaiの非同期版（並行リクエスト用）。"""
+    client = get_async_openai_client()
 
-@dataclass
-class RagExample:
-    sfen: str
-    features_text: str
-    features_text_full: str
-    commentary: str
-    source_file: str | None
-
-
-def _rag_paths(index_base: Path) -> tuple[Path, Path, Path]:
-    # base を "idx" などにしておけば、idx.npz / idx.meta.jsonl / idx.info.json ができる
-    return (
-        index_base.with_suffix(index_base.suffix + ".npz"),
-        index_base.with_suffix(index_base.suffix + ".meta.jsonl"),
-        index_base.with_suffix(index_base.suffix + ".info.json"),
+    resp = await client.responses.create(
+        model=cfg.model,
+        input=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        temperature=cfg.temperature,
+        max_output_tokens=cfg.max_output_tokens,
     )
 
-
-def build_rag_index(
-    examples_jsonl: Path,
-    index_base: Path,
-    embedding_model: str,
-    max_feature_chars: int,
-    max_example_commentary_chars: int,
-    batch_size: int,
-    resume: bool,
-    progress_every: int,
-) -> None:
-    """教師データJSONLから埋め込みインデックスを作る。"""
-
-    import numpy as np  # 遅延import
-
-    npz_path, meta_path, info_path = _rag_paths(index_base)
-    index_base.parent.mkdir(parents=True, exist_ok=True)
-
-    total_lines = count_valid_jsonl_lines(examples_jsonl)
-    existing_embeddings: np.ndarray | None = None
-    start = 0
-    if resume and npz_path.exists() and meta_path.exists():
-        try:
-            with np.load(npz_path) as z:
-                existing_embeddings = z["embeddings"].astype(np.float32)
-            start = count_valid_jsonl_lines(meta_path)
-            if existing_embeddings.shape[0] != start:
-                raise ValueError(
-                    f"既存インデックスが不整合です: embeddings={existing_embeddings.shape[0]}, meta_lines={start}"
-                )
-            print(f"RAGインデックス再開: 既存 {start} 件を検出。追記します", flush=True)
-        except Exception:
-            existing_embeddings = None
-            start = 0
-            print("RAGインデックス再開に失敗したため、最初から作り直します", flush=True)
-
-    embeddings_chunks: list[np.ndarray] = []
-    written = 0
-    batch_texts: list[str] = []
-    batch_meta: list[dict] = []
-    last_report = start
-    start_time = time.time()
-
-    def flush_batch() -> None:
-        nonlocal written, batch_texts, batch_meta, last_report, start_time
-        if not batch_texts:
-            return
-        vectors = _embed_texts(batch_texts, embedding_model=embedding_model)
-        arr = np.asarray(vectors, dtype=np.float32)
-        norms = np.linalg.norm(arr, axis=1, keepdims=True)
-        arr = arr / np.maximum(norms, 1e-12)
-        embeddings_chunks.append(arr)
-
-        # metaは追記（1行=1例、embeddingsと行番号が一致）
-        meta_mode = "a" if (start > 0 or written > 0) else "w"
-        with open(meta_path, meta_mode, encoding="utf-8", buffering=1) as wf:
-            for m in batch_meta:
-                wf.write(json.dumps(m, ensure_ascii=False) + "\n")
-
-        written += len(batch_texts)
-        if progress_every > 0:
-            total_done = start + written
-            if total_done - last_report >= progress_every:
-                elapsed = max(1e-6, time.time() - start_time)
-                done_since_start = max(1, total_done - start)
-                rate = done_since_start / elapsed
-                remaining = max(0, total_lines - total_done)
-                eta = remaining / rate if rate > 0 else 0
-                pct = (total_done / total_lines * 100.0) if total_lines > 0 else 0.0
-                print(
-                    f"RAG進捗: {total_done}/{total_lines} ({pct:.1f}%) | "
-                    f"{_fmt_seconds(elapsed)} 経過 | 残り { _fmt_seconds(eta) }",
-                    flush=True,
-                )
-                last_report = total_done
-        batch_texts = []
-        batch_meta = []
-
-    with open(examples_jsonl, "r", encoding="utf-8") as rf:
-        for i, line in enumerate(rf):
-            if i < start:
-                continue
-            raw = line.strip()
-            if not raw:
-                continue
-            try:
-                rec = json.loads(raw)
-            except Exception:
-                continue
-
-            features_text = rec.get("features_text", "")
-            commentary = rec.get("commentary", "")
-            if not features_text or not commentary:
-                continue
-
-            # 教師解説を除去したフルテキスト
-            features_text_full = _strip_teacher_commentary(features_text)
-            # 埋め込み用に短縮
-            compact = _compact_features_text(features_text, max_chars=max_feature_chars)
-            if not compact:
-                continue
-
-            batch_texts.append(compact)
-            batch_meta.append(
-                {
-                    "sfen": rec.get("sfen", ""),
-                    "features_text": compact,
-                    "features_text_full": features_text_full,
-                    "commentary": _truncate(str(commentary), max_example_commentary_chars),
-                    "source_file": rec.get("source_file"),
-                }
-            )
-
-            if len(batch_texts) >= batch_size:
-                flush_batch()
-
-    flush_batch()
-
-    if existing_embeddings is not None:
-        new_emb = (
-            np.concatenate(embeddings_chunks, axis=0)
-            if embeddings_chunks
-            else np.empty((0, existing_embeddings.shape[1]), dtype=np.float32)
-        )
-        embeddings = np.concatenate([existing_embeddings, new_emb], axis=0)
-    else:
-        embeddings = np.concatenate(embeddings_chunks, axis=0) if embeddings_chunks else None
-
-    if embeddings is None or embeddings.shape[0] == 0:
-        raise RuntimeError("RAGインデックスを作れませんでした（有効データ0件）")
-
-    np.savez_compressed(npz_path, embeddings=embeddings)
-    info = {
-        "embedding_model": embedding_model,
-        "count": int(embeddings.shape[0]),
-        "dim": int(embeddings.shape[1]),
-        "max_feature_chars": max_feature_chars,
-        "max_example_commentary_chars": max_example_commentary_chars,
-        "source_jsonl": str(examples_jsonl),
-        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    text = (resp.output_text or "").strip()
+    meta = {
+        "id": getattr(resp, "id", None),
+        "model": cfg.model,
     }
-    with open(info_path, "w", encoding="utf-8") as wf:
-        wf.write(json.dumps(info, ensure_ascii=False, indent=2))
-
-    print(f"RAGインデックス作成完了: {embeddings.shape[0]}件 (dim={embeddings.shape[1]})", flush=True)
-
-
-def load_rag_index(index_base: Path):
-    import numpy as np  # 遅延import
-
-    npz_path, meta_path, _info_path = _rag_paths(index_base)
-    if not npz_path.exists() or not meta_path.exists():
-        raise FileNotFoundError(f"RAGインデックスが見つかりません: {npz_path} / {meta_path}")
-
-    with np.load(npz_path) as z:
-        embeddings = z["embeddings"].astype(np.float32)
-
-    examples: list[RagExample] = []
-    with open(meta_path, "r", encoding="utf-8") as rf:
-        for line in rf:
-            raw = line.strip()
-            if not raw:
-                continue
-            try:
-                m = json.loads(raw)
-            except Exception:
-                continue
-            examples.append(
-                RagExample(
-                    sfen=str(m.get("sfen", "")),
-                    features_text=str(m.get("features_text", "")),
-                    features_text_full=str(m.get("features_text_full", m.get("features_text", ""))),
-                    commentary=str(m.get("commentary", "")),
-                    source_file=m.get("source_file"),
-                )
-            )
-
-    if embeddings.shape[0] != len(examples):
-        raise ValueError(f"RAGインデックス不整合: embeddings={embeddings.shape[0]}, meta={len(examples)}")
-
-    return embeddings, examples
-
-
-def retrieve_rag_examples(
-    query_features_text: str,
-    embeddings,
-    examples: list[RagExample],
-    embedding_model: str,
-    top_k: int,
-    exclude_sfen: str | None,
-) -> list[RagExample]:
-    import numpy as np  # 遅延import
-
-    vec = _embed_texts([query_features_text], embedding_model=embedding_model)[0]
-    q = np.asarray(vec, dtype=np.float32)
-    q = q / max(float(np.linalg.norm(q)), 1e-12)
-    sims = embeddings @ q
-
-    k = max(0, int(top_k))
-    if k <= 0:
-        return []
-    k = min(k, int(sims.shape[0]))
-
-    idxs = np.argpartition(sims, -k)[-k:]
-    idxs = idxs[np.argsort(-sims[idxs])]
-
-    out: list[RagExample] = []
-    for ix in idxs.tolist():
-        ex = examples[ix]
-        if exclude_sfen and ex.sfen and ex.sfen == exclude_sfen:
-            continue
-        out.append(ex)
-        if len(out) >= k:
-            break
-    return out
+    return text, meta
 
 
 def _moves_to_kif_format(moves: list[str], start_sfen: str) -> str:
     """USI形式の手順をKIF形式に変換する。"""
-    import cshogi
-    import sys
-    from pathlib import Path as _Path
-    sys.path.insert(0, str(_Path(__file__).parent.parent))
-    from src.utils.KIF_to_usi import usi_move_to_kif
+    global _kif_board
+    if _kif_board is None:
+        _kif_board = cshogi.Board()
 
-    board = cshogi.Board(start_sfen)
+    board = _kif_board
+    board.set_sfen(start_sfen)
     kif_moves = []
     prev_to_square = None  # 前回の移動先を追跡
 
@@ -435,6 +161,24 @@ def _moves_to_kif_format(moves: list[str], start_sfen: str) -> str:
 
 def extract_features_text_from_sfen(sfen: str, use_simulation: bool = True) -> str:
     """SFENから features_text を生成する（generate_training_data と同等のパイプライン）。"""
+    return extract_features_texts_from_sfens([sfen], use_simulation=use_simulation)[0]
+
+
+def extract_features_texts_from_sfens(
+    sfens: list[str], use_simulation: bool = True
+) -> list[str]:
+    """複数SFENの features_text をまとめて生成する。
+
+    局面ごとにやねうら王・Maia2へ接続し直すのを避け、1つの
+    シミュレーター接続と特徴抽出器を全局面で使い回す。
+
+    Args:
+        sfens: 対象局面のリスト（SFEN形式）
+        use_simulation: シミュレーション結果を含めるか
+
+    Returns:
+        各局面に対応するfeatures_textのリスト（入力と同順）
+    """
     import sys
     from pathlib import Path as _Path
 
@@ -442,13 +186,8 @@ def extract_features_text_from_sfen(sfen: str, use_simulation: bool = True) -> s
     from src.features.extractor import FeatureExtractor
 
     extractor = FeatureExtractor()
-    static_features = extractor.extract_static(sfen)
-    static_text = extractor.to_text(static_features)
-
-    terminal_features_texts: list[str] = []
-    simulation_info = None
-    best_line_included = False
 
+    simulator = None
     if use_simulation:
         try:
             from src.simulation.game_simulator import GameSimulator
@@ -457,7 +196,36 @@ def extract_features_text_from_sfen(sfen: str, use_simulation: bool = True) -> s
             maia_config = Maia2Config(rating_self=1500, rating_oppo=1500)
             simulator = GameSimulator(maia2_config=maia_config)
             simulator.connect()
+        except Exception as e:
+            print(f"シミュレーションエラー: {e}", flush=True)
+            simulator = None
+
+    try:
+        return [
+            _extract_features_text(sfen, extractor, simulator) for sfen in sfens
+        ]
+    finally:
+        if simulator is not None:
+            simulator.disconnect()
+
+
+# シミュレーション結果テキストの評価値行を書き換えるパターン
+_TERMINAL_SCORE_RE = re.compile(r'^[^\n]*末端評価値:[^\n]*$', re.MULTILINE)
+_SCORE_CHANGE_RE = re.compile(r'^[^\n]*評価値変化:[^\n]*$', re.MULTILINE)
+_STATIC_SCORE_RE = re.compile(r'^[^\S\n]*【評価値】[^\n]*$', re.MULTILINE)
+
+
+def _extract_features_text(sfen: str, extractor, simulator) -> str:
+    """1局面分の features_text を生成する（接続済みリソースを使用）。"""
+    static_features = extractor.extract_static(sfen)
+    static_text = extractor.to_text(static_features)
+
+    terminal_features_texts: list[str] = []
+    simulation_info = None
+    best_line_included = False
 
+    if simulator is not None:
+        try:
             sim_result = simulator.simulate(sfen)
 
             def _win_rate_to_score(win_rate: float) -> int:
@@ -517,16 +285,14 @@ def extract_features_text_from_sfen(sfen: str, use_simulation: bool = True) -> s
                     if score is not None and before_score is not None:
                         change = score - before_score
                         direction = "先手有利に" if change > 0 else "後手有利に" if change < 0 else ""
-                        lines = dynamic_text.split("\n")
-                        new_lines = []
-                        for line in lines:
-                            if "末端評価値:" in line:
-                                new_lines.append(f"  末端評価値: {score:+d}")
-                            elif "評価値変化:" in line:
-                                new_lines.append(f"  評価値変化: {abs(change)} {direction}")
-                            else:
-                                new_lines.append(line)
-                        dynamic_text = "\n".join(new_lines)
+                        # 行ごとのPythonループではなく、コンパイル済み
+                        # 正規表現の一括置換で評価値行を書き換える
+                        dynamic_text = _TERMINAL_SCORE_RE.sub(
+                            f"  末端評価値: {score:+d}", dynamic_text
+                        )
+                        dynamic_text = _SCORE_CHANGE_RE.sub(
+                            f"  評価値変化: {abs(change)} {direction}", dynamic_text
+                        )
                     terminal_features_texts.append(dynamic_text)
                 except Exception:
                     pass
@@ -538,14 +304,9 @@ def extract_features_text_from_sfen(sfen: str, use_simulation: bool = True) -> s
             }
             # 静的特徴の評価値をやねうら王のroot_scoreで上書き
             if before_score is not None:
-                lines = static_text.split("\n")
-                new_lines = []
-                for line in lines:
-                    if line.strip().startswith("【評価値】"):
-                        new_lines.append(f"【評価値】{before_score:+d}")
-                    else:
-                        new_lines.append(line)
-                static_text = "\n".join(new_lines)
+                static_text = _STATIC_SCORE_RE.sub(
+                    f"【評価値】{before_score:+d}", static_text
+                )
         except Exception as e:
             print(f"シミュレーションエラー: {e}", flush=True)
 
@@ -568,6 +329,65 @@ def extract_features_text_from_sfen(sfen: str, use_simulation: bool = True) -> s
     return "\n".join(output_lines)
 
 
+def _estimate_total_lines(path: Path) -> int:
+    """先頭1MiBの平均行長からファイル全体の行数を見積もる（ETA表示用）。"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    with open(path, 'rb') as f:
+        sample = f.read(1 << 20)
+    newlines = sample.count(b'\n')
+    if newlines == 0:
+        return 1
+    avg_bytes_per_line = len(sample) / newlines
+    return max(1, round(size / avg_bytes_per_line))
+
+
+def _count_lines_fast(path: Path) -> int:
+    """改行バイトを数えて行数を求める（行ごとのUTF-8デコードを省く）。"""
+    count = 0
+    last_byte = b'\n'
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            count += chunk.count(b'\n')
+            last_byte = chunk[-1:]
+    if last_byte != b'\n':
+        count += 1  # 末尾に改行がない最終行
+    return count
+
+
+def _get_next_versioned_path(base_dir: Path, prefix: str, suffix: str) -> Path:
+    """重複しないファイル名を生成する（prefix_v1.txt, prefix_v2.txt, ...）。
+
+    既存ファイルが n 個あっても線形走査せず、倍々で上限を見つけてから
+    二分探索するので exists 確認は O(log n) 回で済む。
+    バージョン番号は1から連番で作られる前提。
+    """
+    base_dir.mkdir(parents=True, exist_ok=True)
+
+    def _exists(version: int) -> bool:
+        return (base_dir / f"{prefix}_v{version}{suffix}").exists()
+
+    if not _exists(1):
+        return base_dir / f"{prefix}_v1{suffix}"
+
+    # 存在する下限(lo)と存在しない上限(hi)を倍々で確定する
+    lo, hi = 1, 2
+    while _exists(hi):
+        lo = hi
+        hi *= 2
+
+    # (lo, hi] を二分探索して最小の未使用バージョンを求める
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if _exists(mid):
+            lo = mid
+        else:
+            hi = mid
+
+    return base_dir / f"{prefix}_v{hi}{suffix}"
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="OpenAIで将棋解説文を生成")
     parser.add_argument("--input", required=False, help="入力JSONL（--sfenと排他）")
@@ -591,6 +411,9 @@ def main() -> None:
     parser.add_argument("--temperature", type=float, default=0.7, help="生成温度")
     parser.add_argument("--max-output-tokens", type=int, default=1500, help="最大出力トークン")
     parser.add_argument("--sleep", type=float, default=0.0, help="1リクエストごとの待ち秒")
+    parser.add_argument("--concurrency", type=int, default=4, help="OpenAIへの同時リクエスト数")
+    parser.add_argument("--batch", action="store_true", help="OpenAI Batch APIで一括生成する（オフライン向け・単価半分）")
+    parser.add_argument("--batch-poll-interval", type=float, default=30.0, help="Batch APIのポーリング間隔（秒）")
 
     # RAG（埋め込み + 類似検索）- デフォルトで有効
     parser.add_argument("--no-rag", action="store_true", help="RAGを無効にする（類似例をプロンプトに含めない）")
@@ -697,11 +520,12 @@ def main() -> None:
         print("SFENモード: 特徴抽出→RAG→解説生成を一括実行します", flush=True)
         use_sim = not args.no_simulation
         features_text = extract_features_text_from_sfen(args.sfen, use_simulation=use_sim)
-        features_wo = _strip_teacher_commentary(features_text)
-
         rag_selected: list[RagExample] | None = None
         if rag.enabled and rag_embeddings is not None and rag_examples is not None:
-            query_compact = _compact_features_text(features_text, max_chars=rag.max_feature_chars)
+            # 短縮テキストと教師解説除去済みテキストを1回の走査で作る
+            query_compact, features_wo = _compact_and_full(
+                features_text, max_chars=rag.max_feature_chars
+            )
             rag_selected = retrieve_rag_examples(
                 query_features_text=query_compact,
                 embeddings=rag_embeddings,
@@ -711,6 +535,8 @@ def main() -> None:
                 exclude_sfen=args.sfen,
             )
             print(f"RAGで {len(rag_selected)} 件の参考例を取得しました", flush=True)
+        else:
+            features_wo = _strip_teacher_commentary(features_text)
 
         # スタイル例を読み込む
         style_examples: list[str] | None = None
@@ -731,17 +557,6 @@ def main() -> None:
             style_examples=style_examples,
         )
 
-        # 中間ファイル出力（自動連番対応）
-        def _get_next_versioned_path(base_dir: Path, prefix: str, suffix: str) -> Path:
-            """重複しないファイル名を生成（prefix_v1.txt, prefix_v2.txt, ...）"""
-            base_dir.mkdir(parents=True, exist_ok=True)
-            version = 1
-            while True:
-                path = base_dir / f"{prefix}_v{version}{suffix}"
-                if not path.exists():
-                    return path
-                version += 1
-        
         # save_features の処理
         save_features_path = None
         if args.save_features and args.save_features.lower() != "none":
@@ -824,21 +639,25 @@ def main() -> None:
         max_output_tokens=args.max_output_tokens,
     )
 
-    total_lines = 0
-    # まず入力の総行数だけ数える（ETA用、重いなら省略でもOK）
-    with open(in_path, 'r', encoding='utf-8') as rf:
-        for _ in rf:
-            total_lines += 1
-
+    # 総行数はETA表示とループ上限に使う。--limit指定時は事前走査不要、
+    # 巨大ファイルでは先頭サンプルからの推定で全走査を省く
     if args.limit is not None:
-        total_target = min(total_lines, start_index + args.limit)
+        total_target: int | None = start_index + args.limit
+        report_total = total_target
+        print(f"入力: {in_path}")
+    elif os.path.getsize(in_path) > (64 << 20):
+        total_target = None  # 入力末尾まで（上限なし）
+        report_total = _estimate_total_lines(in_path)
+        print(f"入力: {in_path} (推定総行数: {report_total})")
     else:
+        total_lines = _count_lines_fast(in_path)
         total_target = total_lines
+        report_total = total_lines
+        print(f"入力: {in_path} (総行数: {total_lines})")
 
-    print(f"入力: {in_path} (総行数: {total_lines})")
     print(f"出力: {out_path} (mode={mode})")
     print(f"モデル: {cfg.model}")
-    print(f"範囲: {start_index}行目から {total_target}行目まで")
+    print(f"範囲: {start_index}行目から {total_target if total_target is not None else '末尾'}行目まで")
 
     processed = 0
     success = 0
@@ -854,20 +673,144 @@ def main() -> None:
         elapsed = now - started
         done = success + errors
         avg = (elapsed / done) if done > 0 else 0.0
-        remaining = max(0, (total_target - done_index))
+        remaining = max(0, (report_total - done_index))
         eta = avg * remaining
         print(
-            f"進捗: {done_index}/{total_target} | 完了: {success} | エラー: {errors} | 経過: {_fmt_seconds(elapsed)} | 1件平均: {avg:.2f}秒 | ETA: {_fmt_seconds(eta)}",
+            f"進捗: {done_index}/{report_total} | 完了: {success} | エラー: {errors} | 経過: {_fmt_seconds(elapsed)} | 1件平均: {avg:.2f}秒 | ETA: {_fmt_seconds(eta)}",
             flush=True,
         )
         last_report = now
 
+    # APIリクエストは窓単位で並行化する（出力順は入力順のまま保つ）。
+    # イベントループは生成パス全体で1つを使い回す：窓ごとにasyncio.runを
+    # 呼ぶとAsyncOpenAIの接続プールが閉じたループに縛られたまま再利用され、
+    # 「Event loop is closed」で毎窓リトライに落ちる
+    concurrency = max(1, int(args.concurrency))
+    window: list[dict] = []
+    loop = asyncio.new_event_loop()
+
+    async def _run_window(entries: list[dict]) -> list:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _one(entry: dict):
+            async with semaphore:
+                # リトライ（429等）
+                attempt = 0
+                while True:
+                    attempt += 1
+                    try:
+                        return await call_openai_async(
+                            entry["system"], entry["user"], cfg
+                        )
+                    except Exception as e:
+                        if attempt >= 5:
+                            raise
+                        wait = min(60.0, (2 ** attempt) + random.random())
+                        print(
+                            f"  APIエラー（{type(e).__name__}）: {e} → {wait:.1f}秒待って再試行({attempt}/5)",
+                            flush=True,
+                        )
+                        await asyncio.sleep(wait)
+
+        return await asyncio.gather(
+            *(_one(entry) for entry in entries), return_exceptions=True
+        )
+
     try:
-        with open(in_path, 'r', encoding='utf-8') as rf, open(out_path, mode, encoding='utf-8', buffering=1) as wf:
+        # 出力は行バッファのテキストモードではなくバイナリで開き、
+        # エンコード済みバイト列をそのまま書く
+        with open(in_path, 'r', encoding='utf-8') as rf, open(out_path, mode + 'b', buffering=1 << 16) as wf:
+
+            def _write_entry(entry: dict, generated: str, meta: dict) -> None:
+                nonlocal success
+                record = entry["record"]
+                rag_selected = entry["rag_selected"]
+
+                out_record = dict(record)
+                if args.sanitize_output_features_text and "features_text" in out_record:
+                    # プロンプト作成時に計算済みの除去結果を使い回す
+                    out_record["features_text"] = entry["features_wo"]
+                out_record["generated_commentary"] = generated
+                out_record["generation"] = {
+                    "model": meta.get("model"),
+                    "response_id": meta.get("id"),
+                    "prompt_version": "v2_rag" if rag.enabled else "v1_no_teacher_commentary",
+                    "min_chars": args.min_chars,
+                    "max_chars": args.max_chars,
+                }
+
+                if rag.enabled:
+                    out_record["rag"] = {
+                        "enabled": True,
+                        "top_k": rag.top_k,
+                        "embedding_model": rag.embedding_model,
+                        "index_base": str(rag.index_base) if rag.index_base else None,
+                        "selected": [
+                            {
+                                "sfen": ex.sfen,
+                                "source_file": ex.source_file,
+                            }
+                            for ex in (rag_selected or [])
+                        ],
+                    }
+
+                if orjson is not None:
+                    wf.write(orjson.dumps(out_record, option=orjson.OPT_APPEND_NEWLINE))
+                else:
+                    wf.write(json.dumps(out_record, ensure_ascii=False).encode('utf-8') + b"\n")
+                # Ctrl+C時も書けた行が残るよう、1レコードごとにflushする
+                wf.flush()
+                success += 1
+
+                if args.sleep > 0:
+                    time.sleep(args.sleep)
+
+            def flush_window() -> None:
+                nonlocal errors, window
+                if not window:
+                    return
+
+                outcomes = loop.run_until_complete(_run_window(window))
+                for entry, outcome in zip(window, outcomes):
+                    if isinstance(outcome, BaseException):
+                        errors += 1
+                        if errors <= 5:
+                            print(f"  エラー idx={entry['idx']}: {outcome}", flush=True)
+                        continue
+
+                    generated, meta = outcome
+                    _write_entry(entry, generated, meta)
+
+                window = []
+
+            def flush_via_batch_api() -> None:
+                nonlocal errors, window
+                if not window:
+                    return
+
+                from src.training.openai_batch import build_batch_request, run_batch
+
+                requests = [
+                    build_batch_request(f"idx-{entry['idx']}", entry["system"], entry["user"], cfg)
+                    for entry in window
+                ]
+                results = run_batch(requests, poll_interval=args.batch_poll_interval)
+                for entry in window:
+                    outcome = results.get(f"idx-{entry['idx']}")
+                    if outcome is None:
+                        errors += 1
+                        if errors <= 5:
+                            print(f"  エラー idx={entry['idx']}: Batch結果がありません", flush=True)
+                        continue
+                    generated, meta = outcome
+                    _write_entry(entry, generated, meta)
+
+                window = []
+
             for idx, line in enumerate(rf):
                 if idx < start_index:
                     continue
-                if idx >= total_target:
+                if total_target is not None and idx >= total_target:
                     break
 
                 if idx == start_index or (time.perf_counter() - last_report) >= 30.0:
@@ -890,11 +833,12 @@ def main() -> None:
                     if args.skip_if_features_has_teacher_commentary and _has_teacher_commentary_in_features(features_text):
                         continue
 
-                    features_wo = _strip_teacher_commentary(features_text)
-
                     rag_selected: list[RagExample] | None = None
                     if rag.enabled and rag_embeddings is not None and rag_examples is not None:
-                        query_compact = _compact_features_text(features_text, max_chars=rag.max_feature_chars)
+                        # 短縮テキストと教師解説除去済みテキストを1回の走査で作る
+                        query_compact, features_wo = _compact_and_full(
+                            features_text, max_chars=rag.max_feature_chars
+                        )
                         rag_selected = retrieve_rag_examples(
                             query_features_text=query_compact,
                             embeddings=rag_embeddings,
@@ -903,6 +847,8 @@ def main() -> None:
                             top_k=rag.top_k,
                             exclude_sfen=str(record.get("sfen") or "") or None,
                         )
+                    else:
+                        features_wo = _strip_teacher_commentary(features_text)
 
                     system, user = make_prompt(
                         features_wo,
@@ -912,74 +858,54 @@ def main() -> None:
                         use_full_features=args.rag_no_compact,
                     )
 
-                    # リトライ（429等）
-                    attempt = 0
-                    while True:
-                        attempt += 1
-                        try:
-                            generated, meta = call_openai(system, user, cfg)
-                            break
-                        except Exception as e:
-                            if attempt >= 5:
-                                raise
-                            wait = min(60.0, (2 ** attempt) + random.random())
-                            print(f"  APIエラー（{type(e).__name__}）: {e} → {wait:.1f}秒待って再試行({attempt}/5)", flush=True)
-                            time.sleep(wait)
-
-                    out_record = dict(record)
-                    if args.sanitize_output_features_text and "features_text" in out_record:
-                        out_record["features_text"] = _strip_teacher_commentary(str(out_record.get("features_text") or ""))
-                    out_record["generated_commentary"] = generated
-                    out_record["generation"] = {
-                        "model": meta.get("model"),
-                        "response_id": meta.get("id"),
-                        "prompt_version": "v2_rag" if rag.enabled else "v1_no_teacher_commentary",
-                        "min_chars": args.min_chars,
-                        "max_chars": args.max_chars,
-                    }
-
-                    if rag.enabled:
-                        out_record["rag"] = {
-                            "enabled": True,
-                            "top_k": rag.top_k,
-                            "embedding_model": rag.embedding_model,
-                            "index_base": str(rag.index_base) if rag.index_base else None,
-                            "selected": [
-                                {
-                                    "sfen": ex.sfen,
-                                    "source_file": ex.source_file,
-                                }
-                                for ex in (rag_selected or [])
-                            ],
-                        }
-
-                    wf.write(json.dumps(out_record, ensure_ascii=False) + "\n")
-                    success += 1
-
-                    if args.sleep > 0:
-                        time.sleep(args.sleep)
+                    window.append({
+                        "idx": idx,
+                        "record": record,
+                        "rag_selected": rag_selected,
+                        "features_wo": features_wo,
+                        "system": system,
+                        "user": user,
+                    })
 
                 except Exception as e:
                     errors += 1
                     if errors <= 5:
                         print(f"  エラー idx={idx}: {e}", flush=True)
 
+                # Batchモードでは全件をためて最後に一括送信する
+                if not args.batch and len(window) >= concurrency:
+                    flush_window()
+
                 # 重い処理の直後にも30秒経過なら出す
                 if (time.perf_counter() - last_report) >= 30.0:
                     report(idx + 1)
 
+            if args.batch:
+                flush_via_batch_api()
+            else:
+                flush_window()
+
     except KeyboardInterrupt:
         cancelled = True
         print("\nCtrl+Cを受け取りました。ここまでに生成した分は出力ファイルに残したまま終了します...", flush=True)
+    finally:
+        # ループに紐づくクライアントを閉じてからループを破棄する
+        try:
+            loop.run_until_complete(close_async_openai_client())
+        except Exception:
+            pass
+        loop.close()
 
     # 最終サマリ
     end = time.perf_counter()
     elapsed = end - started
-    done_index = min(total_target, start_index + processed)
+    done_index = start_index + processed
+    if total_target is not None:
+        done_index = min(total_target, done_index)
     done = success + errors
     avg = (elapsed / done) if done > 0 else 0.0
     print(
-        f"完了: {done_index}/{total_target} | 成功: {success} | エラー: {errors} | 経過: {_fmt_seconds(elapsed)} | 1件平均: {avg:.2f}秒" + (" | 中断" if cancelled else ""),
+        f"完了: {done_index}/{report_total} | 成功: {success} | エラー: {errors} | 経過: {_fmt_seconds(elapsed)} | 1件平均: {avg:.2f}秒" + (" | 中断" if cancelled else ""),
         flush=True,
     )
 
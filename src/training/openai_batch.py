@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""OpenAI Batch APIによるオフライン一括生成。
+
+generate_commentary_openai の --batch モードから使う。
+全プロンプトを1つのバッチ入力JSONLにまとめてアップロードし、
+完了をポーリングして結果を custom_id で引けるようにする。
+同期エンドポイントに比べて単価が半分で、リクエストごとの
+ネットワーク往復も発生しない（完全オフラインの一括処理向け）。
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import time
+
+from .commentary_openai_helpers import json_loads
+from .openai_client import get_openai_client
+
+# バッチの終端状態
+_FINISHED_STATUSES = frozenset(("completed", "failed", "expired", "cancelled"))
+
+
+def build_batch_request(custom_id: str, system: str, user: str, cfg) -> dict:
+    """Batch API入力JSONLの1行分を組み立てる。
+
+    Args:
+        custom_id: 結果を突き合わせるためのID
+        system: システムプロンプト
+        user: ユーザープロンプト
+        cfg: OpenAIConfig（model / temperature / max_output_tokens）
+
+    Returns:
+        Batch APIのリクエスト行（dict）
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/responses",
+        "body": {
+            "model": cfg.model,
+            "input": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            "temperature": cfg.temperature,
+            "max_output_tokens": cfg.max_output_tokens,
+        },
+    }
+
+
+def _extract_output_text(body: dict) -> str:
+    """responsesエンドポイントのレスポンスbodyから出力テキストを取り出す。"""
+    texts: list[str] = []
+    for item in body.get("output", []) or []:
+        if item.get("type") != "message":
+            continue
+        for content in item.get("content", []) or []:
+            if content.get("type") == "output_text":
+                texts.append(content.get("text", ""))
+    return "".join(texts).strip()
+
+
+def run_batch(
+    requests: list[dict],
+    poll_interval: float = 30.0,
+    completion_window: str = "24h",
+) -> dict[str, tuple[str, dict]]:
+    """リクエスト群をBatch APIに投げ、完了まで待って結果を返す。
+
+    Args:
+        requests: build_batch_requestで組み立てたリクエスト行のリスト
+        poll_interval: ステータス確認の間隔（秒）
+        completion_window: Batch APIの完了期限
+
+    Returns:
+        custom_id -> (生成テキスト, メタ情報) の辞書。
+        エラーになったリクエストは含まれない
+    """
+    client = get_openai_client()
+
+    payload = "\n".join(
+        json.dumps(req, ensure_ascii=False) for req in requests
+    ).encode("utf-8")
+    batch_file = client.files.create(
+        file=("batch_input.jsonl", io.BytesIO(payload)),
+        purpose="batch",
+    )
+
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/responses",
+        completion_window=completion_window,
+    )
+    print(f"Batch送信: id={batch.id} ({len(requests)}件)", flush=True)
+
+    while batch.status not in _FINISHED_STATUSES:
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+        counts = getattr(batch, "request_counts", None)
+        done = getattr(counts, "completed", "?") if counts else "?"
+        print(f"Batch状態: {batch.status} (完了 {done}/{len(requests)})", flush=True)
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batchが完了しませんでした: status={batch.status}")
+
+    results: dict[str, tuple[str, dict]] = {}
+    content = client.files.content(batch.output_file_id)
+    for line in content.text.splitlines():
+        raw = line.strip()
+        if not raw:
+            continue
+        rec = json_loads(raw)
+        custom_id = rec.get("custom_id")
+        response = rec.get("response") or {}
+        if not custom_id or response.get("status_code") != 200:
+            continue
+        body = response.get("body") or {}
+        text = _extract_output_text(body)
+        meta = {
+            "id": body.get("id"),
+            "model": body.get("model"),
+        }
+        results[custom_id] = (text, meta)
+
+    return results
@@ -1,9 +1,20 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import asyncio
+
+
+# OpenAIクライアントはスレッドセーフなので、呼び出しごとに作らず
+# プロセス内で1つを共有する（生成時のHTTP接続プール構築を省く）
+_client = None
+
 
 def get_openai_client():
     """openai>=1.x を想定。"""
+    global _client
+    if _client is not None:
+        return _client
+
     try:
         from openai import OpenAI  # type: ignore
     except Exception as e:
@@ -11,4 +22,44 @@ def get_openai_client():
             "openai パッケージが見つかりません。requirementsのopenaiを .venv にインストールしてください。"
         ) from e
 
-    return OpenAI()
+    _client = OpenAI()
+    return _client
+
+
+# 非同期クライアントは実行中のイベントループごとに1つを共有する。
+# AsyncOpenAIの接続プールは生成時のループに縛られるため、プロセス全体で
+# 1つをキャッシュすると別ループから使った時点で壊れる
+_async_clients: dict = {}
+
+
+def get_async_openai_client():
+    """非同期版クライアントを返す（openai>=1.x、実行中ループごとに1つを共有）。
+
+    実行中のイベントループ内から呼ぶこと。
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is not None:
+        return client
+
+    try:
+        from openai import AsyncOpenAI  # type: ignore
+    except Exception as e:
+        raise ImportError(
+            "openai パッケージが見つかりません。requirementsのopenaiを .venv にインストールしてください。"
+        ) from e
+
+    client = AsyncOpenAI()
+    _async_clients[loop] = client
+    return client
+
+
+async def close_async_openai_client() -> None:
+    """実行中ループに紐づく非同期クライアントを閉じて破棄する。
+
+    ループを閉じる前に呼ぶことで、接続プールを正しく解放する。
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.close()
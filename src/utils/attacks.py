@@ -16,7 +16,8 @@ def get_piece_attacks(
     board: cshogi.Board,
     square: int,
     piece_type: int,
-    piece_color: int
+    piece_color: int,
+    pieces: List[int] = None
 ) -> List[int]:
     """
     指定した駒の利き先マスのリストを取得する。
@@ -26,6 +27,9 @@ def get_piece_attacks(
         square: 駒のいるマス（0-80）
         piece_type: 駒種（1-14）
         piece_color: 駒の色（BLACK=0, WHITE=1）
+        pieces: board.piecesのスナップショット（省略可）。
+            指定すると飛び駒の走査でboard.piece()の代わりに
+            リスト参照を使い、C呼び出しの回数を減らせる
 
     Returns:
         利き先マスのリスト（マスインデックス0-80）
@@ -49,13 +53,15 @@ def get_piece_attacks(
             
     elif piece_type == cshogi.LANCE:  # 香
         # 前方に直進
+        if pieces is None:
+            pieces = board.pieces
         dr = -1 if piece_color == cshogi.BLACK else 1
         r = rank_from + dr
         while 0 <= r <= 8:
             sq = file_from * 9 + r
             attacks.append(sq)
             # 駒があれば止まる
-            if board.piece(sq) != cshogi.NONE:
+            if pieces[sq] != cshogi.NONE:
                 break
             r += dr
             
@@ -95,19 +101,22 @@ def get_piece_attacks(
     elif piece_type == cshogi.BISHOP:  # 角
         attacks = _get_sliding_attacks(
             board, file_from, rank_from,
-            [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+            [(-1, -1), (-1, 1), (1, -1), (1, 1)],
+            pieces
         )
         
     elif piece_type == cshogi.ROOK:  # 飛
         attacks = _get_sliding_attacks(
             board, file_from, rank_from,
-            [(-1, 0), (1, 0), (0, -1), (0, 1)]
+            [(-1, 0), (1, 0), (0, -1), (0, 1)],
+            pieces
         )
         
     elif piece_type == cshogi.PROM_BISHOP:  # 馬
         attacks = _get_sliding_attacks(
             board, file_from, rank_from,
-            [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+            [(-1, -1), (-1, 1), (1, -1), (1, 1)],
+            pieces
         )
         # 十字方向1マス追加
         for df, dr in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
@@ -116,7 +125,8 @@ def get_piece_attacks(
     elif piece_type == cshogi.PROM_ROOK:  # 龍
         attacks = _get_sliding_attacks(
             board, file_from, rank_from,
-            [(-1, 0), (1, 0), (0, -1), (0, 1)]
+            [(-1, 0), (1, 0), (0, -1), (0, 1)],
+            pieces
         )
         # 斜め方向1マス追加
         for df, dr in [(-1, -1), (-1, 1), (1, -1), (1, 1)]:
@@ -146,7 +156,8 @@ def _get_sliding_attacks(
     board: cshogi.Board,
     file_from: int,
     rank_from: int,
-    directions: List[tuple]
+    directions: List[tuple],
+    pieces: List[int] = None
 ) -> List[int]:
     """
     飛び駒（香・角・飛・馬・龍）の利きを取得する。
@@ -156,17 +167,20 @@ def _get_sliding_attacks(
         file_from: 駒の筋（0-8）
         rank_from: 駒の段（0-8）
         directions: 探索方向のリスト（(df, dr)のタプル）
+        pieces: board.piecesのスナップショット（省略可）
 
     Returns:
         利き先マスのリスト
     """
+    if pieces is None:
+        pieces = board.pieces
     attacks = []
     for df, dr in directions:
         f, r = file_from + df, rank_from + dr
         while 0 <= f <= 8 and 0 <= r <= 8:
             sq = f * 9 + r
             attacks.append(sq)
-            if board.piece(sq) != cshogi.NONE:
+            if pieces[sq] != cshogi.NONE:
                 break
             f += df
             r += dr